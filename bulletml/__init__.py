@@ -21,7 +21,7 @@ Basic Usage:
 
     from bulletml import Bullet, BulletML
 
-    doc = BulletML.FromDocument(open("test.xml", "rU"))
+    doc = BulletML.FromDocument(open("test.xml", "rb"))
     player = ...  # On your own here, but it needs x and y fields.
     rank = 0.5    # Player difficulty, 0 to 1
 
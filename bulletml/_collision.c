@@ -1,8 +1,16 @@
 #include "Python.h"
 
+#if defined(__AVX__)
+#include <immintrin.h>
+#elif defined(__SSE2__) || defined(_M_X64)
+#include <emmintrin.h>
+#define USE_SSE2 1
+#endif
+
 #define STR_AND_SIZE(s) s, sizeof(s) - 1
 #define DOT(x1, y1, x2, y2) ((x1) * (x2) + (y1) * (y2))
-#define NEARZERO(d) ((d) < 0.0001 && (d) > -0.0001)
+// Added to divisors that may be zero; far smaller than any radius.
+#define EPSILON 1e-30
 
 static const char *s_pchModDoc = "Optimized collision detection functions.";
 
@@ -31,7 +39,17 @@ static const char s_achCollidesAllDoc[] = (
     "Filter the second argument to those that collide with the first.\n\n"
     "This is equivalent to filter(lambda o: collides(a, o), others),\n"
     "but is much faster when the compiled extension is available (which\n"
-    "it is currently).\n\n");
+    "it is currently). Where available, SSE2 or AVX are used to test\n"
+    "several circles at once.\n\n");
+
+static const char s_achCollidesMaskDoc[] = (
+    "collides_mask(ax, ay, apx, apy, ar, bx, by, bpx, bpy, br, out)\n\n"
+    "Set out[i] to whether moving circle i collides with a.\n\n"
+    "a is given as numbers. The b arguments are equal-length contiguous\n"
+    "buffers of doubles (e.g. float64 NumPy arrays), and out is a\n"
+    "writable contiguous buffer of bytes (e.g. a bool NumPy array) of\n"
+    "the same length. Where available, SSE2 or AVX are used to test\n"
+    "several circles at once.\n\n");
 
 // Get the attributes from a Python moving circle object.
 static int GetCircle(PyObject *ppy, double *pdX, double *pdY,
@@ -120,23 +138,18 @@ static int Collides(double dXA, double dXB, double dYA, double dYB,
     double dDiffX = dPXA - dPXB;
     double dDiffY = dPYA - dPYB;
 
-    // B didn't move relative to A, so early-out by doing point/circle.
-    if (NEARZERO(dDirX) && NEARZERO(dDirY))
-        return dDiffX * dDiffX + dDiffY * dDiffY <= dR * dR;
-    else
-    {
-        double dT = (DOT(dDiffX, dDiffY, dDirX, dDirY)
-                     / DOT(dDirX, dDirY, dDirX, dDirY));
-        double dDistX;
-        double dDistY;
-        if (dT < 0.0) dT = 0.0;
-        else if (dT > 1.0) dT = 1.0;
+    // If B didn't move relative to A, dT is 0 and this is point/circle.
+    double dT = (DOT(dDiffX, dDiffY, dDirX, dDirY)
+                 / (DOT(dDirX, dDirY, dDirX, dDirY) + EPSILON));
+    double dDistX;
+    double dDistY;
+    dT = dT < 0.0 ? 0.0 : dT;
+    dT = dT > 1.0 ? 1.0 : dT;
 
-        dDistX = dPXA - (dPXB + dDirX * dT);
-        dDistY = dPYA - (dPYB + dDirY * dT);
+    dDistX = dPXA - (dPXB + dDirX * dT);
+    dDistY = dPYA - (dPYB + dDirY * dT);
 
-        return dDistX * dDistX + dDistY * dDistY <= dR * dR;
-    }
+    return dDistX * dDistX + dDistY * dDistY <= dR * dR;
 }
 
 static PyObject *py_overlaps(PyObject *ppySelf, PyObject *ppyArgs) {
@@ -186,56 +199,298 @@ static PyObject *py_collides(PyObject *ppySelf, PyObject *ppyArgs)
         return NULL;
 }
 
+#if defined(__AVX__)
+// Test circles [sz, sz + 4) against A. Returns a 4-bit mask of hits.
+static int Collides4(double dXA, double dYA, double dPXA, double dPYA,
+                     double dRA, const double *pdXB, const double *pdYB,
+                     const double *pdPXB, const double *pdPYB,
+                     const double *pdRB)
+{
+    const __m256d vEps = _mm256_set1_pd(EPSILON);
+    const __m256d vZero = _mm256_setzero_pd();
+    const __m256d vOne = _mm256_set1_pd(1.0);
+    __m256d vPXB = _mm256_loadu_pd(pdPXB);
+    __m256d vPYB = _mm256_loadu_pd(pdPYB);
+    __m256d vR = _mm256_add_pd(_mm256_set1_pd(dRA), _mm256_loadu_pd(pdRB));
+    __m256d vDirX = _mm256_sub_pd(
+        _mm256_add_pd(_mm256_set1_pd(dPXA - dXA), _mm256_loadu_pd(pdXB)),
+        vPXB);
+    __m256d vDirY = _mm256_sub_pd(
+        _mm256_add_pd(_mm256_set1_pd(dPYA - dYA), _mm256_loadu_pd(pdYB)),
+        vPYB);
+    __m256d vDiffX = _mm256_sub_pd(_mm256_set1_pd(dPXA), vPXB);
+    __m256d vDiffY = _mm256_sub_pd(_mm256_set1_pd(dPYA), vPYB);
+    __m256d vT = _mm256_div_pd(
+        _mm256_add_pd(_mm256_mul_pd(vDiffX, vDirX),
+                      _mm256_mul_pd(vDiffY, vDirY)),
+        _mm256_add_pd(_mm256_add_pd(_mm256_mul_pd(vDirX, vDirX),
+                                    _mm256_mul_pd(vDirY, vDirY)), vEps));
+    __m256d vDistX, vDistY, vHit;
+    vT = _mm256_min_pd(_mm256_max_pd(vT, vZero), vOne);
+    vDistX = _mm256_sub_pd(vDiffX, _mm256_mul_pd(vDirX, vT));
+    vDistY = _mm256_sub_pd(vDiffY, _mm256_mul_pd(vDirY, vT));
+    vHit = _mm256_cmp_pd(
+        _mm256_add_pd(_mm256_mul_pd(vDistX, vDistX),
+                      _mm256_mul_pd(vDistY, vDistY)),
+        _mm256_mul_pd(vR, vR), _CMP_LE_OQ);
+    return _mm256_movemask_pd(vHit);
+}
+#define LANES 4
+#define COLLIDES_N Collides4
+#elif defined(USE_SSE2)
+// Test circles [sz, sz + 2) against A. Returns a 2-bit mask of hits.
+static int Collides2(double dXA, double dYA, double dPXA, double dPYA,
+                     double dRA, const double *pdXB, const double *pdYB,
+                     const double *pdPXB, const double *pdPYB,
+                     const double *pdRB)
+{
+    const __m128d vEps = _mm_set1_pd(EPSILON);
+    const __m128d vZero = _mm_setzero_pd();
+    const __m128d vOne = _mm_set1_pd(1.0);
+    __m128d vPXB = _mm_loadu_pd(pdPXB);
+    __m128d vPYB = _mm_loadu_pd(pdPYB);
+    __m128d vR = _mm_add_pd(_mm_set1_pd(dRA), _mm_loadu_pd(pdRB));
+    __m128d vDirX = _mm_sub_pd(
+        _mm_add_pd(_mm_set1_pd(dPXA - dXA), _mm_loadu_pd(pdXB)), vPXB);
+    __m128d vDirY = _mm_sub_pd(
+        _mm_add_pd(_mm_set1_pd(dPYA - dYA), _mm_loadu_pd(pdYB)), vPYB);
+    __m128d vDiffX = _mm_sub_pd(_mm_set1_pd(dPXA), vPXB);
+    __m128d vDiffY = _mm_sub_pd(_mm_set1_pd(dPYA), vPYB);
+    __m128d vT = _mm_div_pd(
+        _mm_add_pd(_mm_mul_pd(vDiffX, vDirX), _mm_mul_pd(vDiffY, vDirY)),
+        _mm_add_pd(_mm_add_pd(_mm_mul_pd(vDirX, vDirX),
+                              _mm_mul_pd(vDirY, vDirY)), vEps));
+    __m128d vDistX, vDistY, vHit;
+    vT = _mm_min_pd(_mm_max_pd(vT, vZero), vOne);
+    vDistX = _mm_sub_pd(vDiffX, _mm_mul_pd(vDirX, vT));
+    vDistY = _mm_sub_pd(vDiffY, _mm_mul_pd(vDirY, vT));
+    vHit = _mm_cmple_pd(
+        _mm_add_pd(_mm_mul_pd(vDistX, vDistX), _mm_mul_pd(vDistY, vDistY)),
+        _mm_mul_pd(vR, vR));
+    return _mm_movemask_pd(vHit);
+}
+#define LANES 2
+#define COLLIDES_N Collides2
+#endif
+
 static PyObject *py_collides_all(PyObject *ppySelf, PyObject *ppyArgs)
 {
     double dXA, dYA, dPXA, dPYA, dRA;
-    PyObject *ppyA, *ppyOthers;
-    if (PyArg_ParseTuple(ppyArgs, "OO", &ppyA, &ppyOthers)
-        && GetCircle(ppyA, &dXA, &dYA, &dPXA, &dPYA, &dRA))
+    PyObject *ppyA, *ppyOthers, *ppySeq, *ppyRet;
+    PyObject **appyItems;
+    double *pdBuf;
+    double *pdXB, *pdYB, *pdPXB, *pdPYB, *pdRB;
+    Py_ssize_t pyszLen, sz;
+
+    if (!(PyArg_ParseTuple(ppyArgs, "OO", &ppyA, &ppyOthers)
+          && GetCircle(ppyA, &dXA, &dYA, &dPXA, &dPYA, &dRA)))
+        return NULL;
+
+    // GetCircle can run arbitrary Python code that changes others, so
+    // use a tuple that owns its items rather than borrowing a list's.
+    ppySeq = PySequence_Tuple(ppyOthers);
+    if (!ppySeq)
+        return NULL;
+    pyszLen = PyTuple_GET_SIZE(ppySeq);
+    appyItems = PySequence_Fast_ITEMS(ppySeq);
+
+    // Gather the other circles into parallel arrays.
+    pdBuf = PyMem_Malloc(sizeof(double) * 5 * (pyszLen ? pyszLen : 1));
+    if (!pdBuf)
+    {
+        Py_DECREF(ppySeq);
+        return PyErr_NoMemory();
+    }
+    pdXB = pdBuf;
+    pdYB = pdXB + pyszLen;
+    pdPXB = pdYB + pyszLen;
+    pdPYB = pdPXB + pyszLen;
+    pdRB = pdPYB + pyszLen;
+    for (sz = 0; sz < pyszLen; sz++)
     {
-        PyObject *ppyRet = PyList_New(0);
-        Py_ssize_t pyszLen = ppyRet ? PySequence_Length(ppyOthers) : -1;
-        if (pyszLen >= 0)
+        if (!GetCircle(appyItems[sz], &pdXB[sz], &pdYB[sz],
+                       &pdPXB[sz], &pdPYB[sz], &pdRB[sz]))
         {
-            Py_ssize_t sz;
-            for (sz = 0; sz < pyszLen; sz++)
-            {
-                double dXB, dYB, dPXB, dPYB, dRB;
-                PyObject *ppyB = PySequence_GetItem(ppyOthers, sz);
-                if (!GetCircle(ppyB, &dXB, &dYB, &dPXB, &dPYB, &dRB))
-                {
-                    Py_XDECREF(ppyB);
-                    return NULL;
-                }
-                else if (Collides(dXA, dXB, dYA, dYB, dPXA, dPXB, dPYA, dPYB,
-                                  dRA, dRB))
-                    PyList_Append(ppyRet, ppyB);
-                Py_DECREF(ppyB);
-            }
-            return ppyRet;
-        }
-        else
+            PyMem_Free(pdBuf);
+            Py_DECREF(ppySeq);
             return NULL;
+        }
     }
-    else
+
+    ppyRet = PyList_New(0);
+    if (!ppyRet)
+    {
+        PyMem_Free(pdBuf);
+        Py_DECREF(ppySeq);
+        return NULL;
+    }
+
+    sz = 0;
+#ifdef LANES
+    for (; sz + LANES <= pyszLen; sz += LANES)
+    {
+        int iMask = COLLIDES_N(dXA, dYA, dPXA, dPYA, dRA,
+                               &pdXB[sz], &pdYB[sz], &pdPXB[sz], &pdPYB[sz],
+                               &pdRB[sz]);
+        int i;
+        for (i = 0; iMask; i++, iMask >>= 1)
+        {
+            if ((iMask & 1) && PyList_Append(ppyRet, appyItems[sz + i]))
+                goto error;
+        }
+    }
+#endif
+    for (; sz < pyszLen; sz++)
+    {
+        if (Collides(dXA, pdXB[sz], dYA, pdYB[sz], dPXA, pdPXB[sz],
+                     dPYA, pdPYB[sz], dRA, pdRB[sz])
+            && PyList_Append(ppyRet, appyItems[sz]))
+            goto error;
+    }
+
+    PyMem_Free(pdBuf);
+    Py_DECREF(ppySeq);
+    return ppyRet;
+
+error:
+    PyMem_Free(pdBuf);
+    Py_DECREF(ppySeq);
+    Py_DECREF(ppyRet);
+    return NULL;
+}
+
+// Get a contiguous buffer of *pszLen items of the given size and
+// format. If *pszLen is negative, set it to the buffer's length.
+static int GetArray(PyObject *ppy, Py_buffer *pbuf, int iFlags,
+                    Py_ssize_t szItem, const char *pchFormats,
+                    Py_ssize_t *pszLen)
+{
+    if (PyObject_GetBuffer(ppy, pbuf, iFlags | PyBUF_C_CONTIGUOUS
+                           | PyBUF_FORMAT) < 0)
+        return 0;
+    if (pbuf->itemsize != szItem || !pbuf->format
+        || !pbuf->format[0] || pbuf->format[1]
+        || !strchr(pchFormats, pbuf->format[0]))
+    {
+        PyErr_Format(PyExc_TypeError, "expected an array of '%s' items",
+                     pchFormats);
+        PyBuffer_Release(pbuf);
+        return 0;
+    }
+    if (*pszLen < 0)
+        *pszLen = pbuf->len / szItem;
+    else if (pbuf->len / szItem != *pszLen)
+    {
+        PyErr_SetString(PyExc_ValueError, "arrays must be the same length");
+        PyBuffer_Release(pbuf);
+        return 0;
+    }
+    return 1;
+}
+
+static PyObject *py_collides_mask(PyObject *ppySelf, PyObject *ppyArgs)
+{
+    double dXA, dYA, dPXA, dPYA, dRA;
+    PyObject *appyArrays[6];
+    Py_buffer abuf[6];
+    const double *pdXB, *pdYB, *pdPXB, *pdPYB, *pdRB;
+    char *pchOut;
+    Py_ssize_t pyszLen = -1, sz;
+    int i, iGot = 0;
+
+    if (!PyArg_ParseTuple(ppyArgs, "dddddOOOOOO", &dXA, &dYA, &dPXA, &dPYA,
+                          &dRA, &appyArrays[0], &appyArrays[1],
+                          &appyArrays[2], &appyArrays[3], &appyArrays[4],
+                          &appyArrays[5]))
         return NULL;
+
+    for (; iGot < 5; iGot++)
+    {
+        if (!GetArray(appyArrays[iGot], &abuf[iGot], PyBUF_SIMPLE,
+                      sizeof(double), "d", &pyszLen))
+            goto error;
+    }
+    if (!GetArray(appyArrays[5], &abuf[5], PyBUF_WRITABLE, 1, "?Bbc",
+                  &pyszLen))
+        goto error;
+    iGot++;
+
+    pdXB = abuf[0].buf;
+    pdYB = abuf[1].buf;
+    pdPXB = abuf[2].buf;
+    pdPYB = abuf[3].buf;
+    pdRB = abuf[4].buf;
+    pchOut = abuf[5].buf;
+
+    sz = 0;
+#ifdef LANES
+    for (; sz + LANES <= pyszLen; sz += LANES)
+    {
+        int iMask = COLLIDES_N(dXA, dYA, dPXA, dPYA, dRA,
+                               &pdXB[sz], &pdYB[sz], &pdPXB[sz], &pdPYB[sz],
+                               &pdRB[sz]);
+        for (i = 0; i < LANES; i++)
+            pchOut[sz + i] = (iMask >> i) & 1;
+    }
+#endif
+    for (; sz < pyszLen; sz++)
+    {
+        pchOut[sz] = Collides(dXA, pdXB[sz], dYA, pdYB[sz], dPXA, pdPXB[sz],
+                              dPYA, pdPYB[sz], dRA, pdRB[sz]);
+    }
+
+    for (i = 0; i < iGot; i++)
+        PyBuffer_Release(&abuf[i]);
+    Py_RETURN_NONE;
+
+error:
+    for (i = 0; i < iGot; i++)
+        PyBuffer_Release(&abuf[i]);
+    return NULL;
 }
 
 static struct PyMethodDef s_apymeth[] = {
     {"overlaps", py_overlaps, METH_VARARGS, s_achOverlapsDoc },
     {"collides", py_collides, METH_VARARGS, s_achCollidesDoc },
     {"collides_all", py_collides_all, METH_VARARGS, s_achCollidesAllDoc },
+    {"collides_mask", py_collides_mask, METH_VARARGS, s_achCollidesMaskDoc },
     {NULL, NULL, 0, NULL}
 };
 
-PyMODINIT_FUNC init_collision(void)
+static int InitKeys(void)
 {
+#if PY_MAJOR_VERSION >= 3
+    s_ppykX = PyUnicode_InternFromString("x");
+    s_ppykY = PyUnicode_InternFromString("y");
+    s_ppykPX = PyUnicode_InternFromString("px");
+    s_ppykPY = PyUnicode_InternFromString("py");
+    s_ppykRadius = PyUnicode_InternFromString("radius");
+#else
     s_ppykX = PyString_FromStringAndSize(STR_AND_SIZE("x"));
     s_ppykY = PyString_FromStringAndSize(STR_AND_SIZE("y"));
     s_ppykPX = PyString_FromStringAndSize(STR_AND_SIZE("px"));
     s_ppykPY = PyString_FromStringAndSize(STR_AND_SIZE("py"));
     s_ppykRadius = PyString_FromStringAndSize(STR_AND_SIZE("radius"));
+#endif
+    return s_ppykX && s_ppykY && s_ppykPX && s_ppykPY && s_ppykRadius;
+}
+
+#if PY_MAJOR_VERSION >= 3
+static struct PyModuleDef s_pymod = {
+    PyModuleDef_HEAD_INIT, "bulletml._collision", NULL, -1, s_apymeth
+};
 
-    if (s_ppykX && s_ppykY && s_ppykPX && s_ppykPY && s_ppykRadius)
+PyMODINIT_FUNC PyInit__collision(void)
+{
+    s_pymod.m_doc = s_pchModDoc;
+    if (!InitKeys())
+        return NULL;
+    return PyModule_Create(&s_pymod);
+}
+#else
+PyMODINIT_FUNC init_collision(void)
+{
+    if (InitKeys())
         Py_InitModule3("bulletml._collision", s_apymeth, s_pchModDoc);
 }
+#endif
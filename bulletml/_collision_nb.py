@@ -0,0 +1,57 @@
+"""Numba-compiled collision detection kernels.
+
+These are the same tests as in bulletml.collision, compiled with
+Numba. Importing this module raises ImportError if Numba is not
+installed; bulletml.collision uses it automatically if it is.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from numba import boolean, float64, njit, prange
+
+from bulletml.collision import EPSILON
+
+@njit(boolean(float64, float64, float64, float64, float64,
+              float64, float64, float64, float64, float64),
+      cache=True, fastmath=True, boundscheck=False)
+def _collides_kernel(xa, ya, pxa, pya, ra, xb, yb, pxb, pyb, rb):
+    """Return true if the two moving circles collide."""
+    radius = ra + rb
+
+    # Reject if the bounding boxes of their movement don't overlap.
+    if (max(xa, pxa) + radius < min(xb, pxb)
+        or max(xb, pxb) + radius < min(xa, pxa)
+        or max(ya, pya) + radius < min(yb, pyb)
+        or max(yb, pyb) + radius < min(ya, pya)):
+        return False
+
+    # Translate b's final position to be relative to a's start.
+    dir_x = pxa + (xb - xa) - pxb
+    dir_y = pya + (yb - ya) - pyb
+
+    diff_x = pxa - pxb
+    diff_y = pya - pyb
+
+    # If b did not move relative to a, t is 0: a point/circle test.
+    t = ((diff_x * dir_x + diff_y * dir_y)
+         / (dir_x * dir_x + dir_y * dir_y + EPSILON))
+    if t < 0.0:
+        t = 0.0
+    elif t > 1.0:
+        t = 1.0
+
+    dist_x = pxa - (pxb + dir_x * t)
+    dist_y = pya - (pyb + dir_y * t)
+    return dist_x * dist_x + dist_y * dist_y <= radius * radius
+
+@njit(cache=True, fastmath=True, boundscheck=False, parallel=True)
+def _collides_all_kernel(xa, ya, pxa, pya, ra, bx, by, bpx, bpy, br):
+    """Return a boolean array, true where b[i] collides with a."""
+    n = bx.shape[0]
+    out = np.empty(n, dtype=np.bool_)
+    for i in prange(n):
+        out[i] = _collides_kernel(xa, ya, pxa, pya, ra,
+                                  bx[i], by[i], bpx[i], bpy[i], br[i])
+    return out
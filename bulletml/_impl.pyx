@@ -0,0 +1,287 @@
+# cython: language_level=3
+"""Compiled BulletML implementation.
+
+These are the same classes as in bulletml.impl, with typed fields.
+bulletml.impl uses them automatically if they were compiled and
+installed with the module.
+"""
+
+from libc.math cimport atan2, sin, cos
+
+# Must match the opcodes in bulletml.impl.
+cdef enum:
+    OP_CALL = 0
+    OP_WAIT = 1
+
+cdef class Action:
+    """Running action implementation (compiled).
+
+    See bulletml.impl.Action.
+    """
+
+    cdef public object actions
+    cdef public object parent
+    cdef public int repeat
+    cdef public int wait_frames
+    cdef public double speed
+    cdef public int speed_frames
+    cdef public double direction
+    cdef public int direction_frames
+    cdef public bint aiming
+    cdef public double mx
+    cdef public double my
+    cdef public int accel_frames
+    cdef public double previous_fire_direction
+    cdef public double previous_fire_speed
+    cdef public object params
+    cdef public object pc
+    cdef public bint finished
+
+    def __init__(self, parent, actions, params, rank, repeat=1):
+        if actions and not isinstance(actions[0], tuple):
+            # Late import; bulletml.impl imports this module.
+            from bulletml.impl import compile_actions
+            actions = compile_actions(actions)
+        self.actions = actions
+        self.parent = parent
+        self.repeat = repeat
+        self.wait_frames = 0
+        self.speed = 0
+        self.speed_frames = 0
+        self.direction = 0
+        self.direction_frames = 0
+        self.aiming = False
+        self.mx = 0
+        self.my = 0
+        self.accel_frames = 0
+        self.previous_fire_direction = 0
+        self.previous_fire_speed = 0
+        self.params = params
+        self.pc = -1
+        self.finished = False
+        if parent:
+            self.copy_state(parent)
+
+    def __repr__(self):
+        return "%s(pc=%r, actions=%r)" % (
+            type(self).__name__, self.pc, self.actions)
+
+    def vanish(self):
+        """End this action and its parents."""
+        if self.parent:
+            self.parent.vanish()
+        self.pc = None
+        self.finished = True
+
+    def copy_state(self, other):
+        """Copy fire/movement state from other to self."""
+        self.direction_frames = other.direction_frames
+        self.direction = other.direction
+        self.aiming = other.aiming
+        self.speed_frames = other.speed_frames
+        self.speed = other.speed
+        self.accel_frames = other.accel_frames
+        self.mx = other.mx
+        self.my = other.my
+        self.previous_fire_direction = other.previous_fire_direction
+        self.previous_fire_speed = other.previous_fire_speed
+
+    def step(self, owner, created):
+        """Advance by one frame."""
+        cdef Py_ssize_t pc, n
+
+        # Finished actions with no changes left in progress do nothing.
+        if (self.pc is None and self.speed_frames <= 0
+            and self.direction_frames <= 0 and self.accel_frames <= 0):
+            return
+
+        if self.speed_frames > 0:
+            self.speed_frames -= 1
+            owner.speed += self.speed
+
+        if self.direction_frames > 0:
+            self.direction_frames -= 1
+            # I'm still not sure what the aim check is supposed to do.
+            if self.aiming and self.direction_frames <= 0:
+                owner.direction += owner.aim
+            else:
+                owner.direction += self.direction
+
+        if self.accel_frames > 0:
+            self.accel_frames -= 1
+            owner.mx += self.mx
+            owner.my += self.my
+
+        if self.pc is None:
+            return
+
+        if self.wait_frames > 0:
+            self.wait_frames -= 1
+            return
+
+        s_params = self.params
+        rank = owner.rank
+        code = self.actions
+        n = len(code)
+        pc = self.pc
+
+        while True:
+            pc += 1
+
+            if pc >= n:
+                self.repeat -= 1
+                if self.repeat <= 0:
+                    self.pc = None
+                    self.finished = True
+                    if self.parent is not None:
+                        self.parent.copy_state(self)
+                        owner.replace(self, self.parent)
+                    break
+                else:
+                    pc = -1
+                    continue
+
+            # Actions may read or reset pc (e.g. vanishing), so
+            # store it before running them.
+            self.pc = pc
+            op, arg = code[pc]
+            if op == OP_WAIT:
+                self.wait_frames = arg(s_params, rank)
+                break
+            elif arg(owner, self, s_params, rank, created):
+                break
+
+cdef class Bullet:
+    """Simple bullet implementation (compiled).
+
+    See bulletml.impl.Bullet.
+    """
+
+    cdef public double x, y, px, py, mx, my
+    cdef public double direction, speed, rank, radius
+    cdef public bint vanished, finished
+    cdef public object target, tags, appearance, actions
+    cdef double _trigdir, _sindir, _cosdir, _aim
+    cdef bint _aimed, _stepping, _hastrig
+
+    def __init__(self, x=0, y=0, direction=0, speed=0, target=None,
+                 actions=(), rank=0.5, tags=(), appearance=None,
+                 radius=0.5):
+        self.x = self.px = x
+        self.y = self.py = y
+        self.radius = radius
+        self.mx = 0
+        self.my = 0
+        self.direction = direction
+        # Many bullets change direction before they first move, so
+        # don't compute sin/cos until then. (Not a NaN _trigdir; that
+        # breaks under -ffast-math.)
+        self._hastrig = False
+        self._trigdir = self._sindir = self._cosdir = 0
+        self._aimed = False
+        self._stepping = False
+        self.speed = speed
+        self.vanished = False
+        self.finished = False
+        self.target = target
+        self.rank = rank
+        self.tags = set(tags)
+        self.appearance = appearance
+        self.actions = list(actions)
+
+    @classmethod
+    def FromDocument(cls, doc, x=0, y=0, direction=0, speed=0, target=None,
+                     params=(), rank=0.5, Action=Action):
+        """Construct a new Bullet from a loaded BulletML document."""
+        # Actions are built fresh rather than copied from a cached
+        # template; it's cheaper than copying, and parameters may use
+        # $rand, so they must be evaluated for each bullet.
+        actions = [action(None, Action, params, rank)
+                   for action in doc.actions]
+        return cls(x=x, y=y, direction=direction, speed=speed,
+                   target=target, actions=actions, rank=rank)
+
+    def __repr__(self):
+        return ("%s(%r, %r, accel=%r, direction=%r, speed=%r, "
+                "actions=%r, target=%r, appearance=%r, vanished=%r)") % (
+            type(self).__name__, self.x, self.y, (self.mx, self.my),
+            self.direction, self.speed, self.actions, self.target,
+            self.appearance, self.vanished)
+
+    @property
+    def aim(self):
+        """Angle to the target, in radians.
+
+        If the target does not exist or cannot be found, return 0.
+        """
+        cdef double target_x, target_y, aim
+        if self._aimed:
+            return self._aim
+        try:
+            target_x = self.target.x
+            target_y = self.target.y
+        except AttributeError:
+            return 0
+        aim = atan2(target_x - self.x, target_y - self.y)
+        if self._stepping:
+            self._aim = aim
+            self._aimed = True
+        return aim
+
+    def vanish(self):
+        """Vanish this bullet and stop all actions."""
+        self.vanished = True
+        for action in self.actions:
+            action.vanish()
+        self.actions = []
+
+    def replace(self, old, new):
+        """Replace an active action with another.
+
+        This is mostly used by actions internally to queue children.
+        """
+        try:
+            idx = self.actions.index(old)
+        except ValueError:
+            pass
+        else:
+            self.actions[idx] = new
+
+    def step(self):
+        """Advance by one frame.
+
+        This updates the position and velocity, and may also set the
+        vanished flag.
+
+        It returns any new bullets this bullet spawned during this step.
+        """
+        cdef double speed, direction
+        cdef bint finished
+        created = []
+
+        finished = self.vanished
+        self._stepping = True
+        for action in self.actions:
+            action.step(self, created)
+            finished = finished and action.finished
+        self._stepping = False
+        self._aimed = False
+        if finished:
+            for action in self.actions:
+                finished = finished and action.finished
+        self.finished = finished
+
+        speed = self.speed
+        direction = self.direction
+        # Direction usually stays the same for many frames.
+        if direction != self._trigdir or not self._hastrig:
+            self._hastrig = True
+            self._trigdir = direction
+            self._sindir = sin(direction)
+            self._cosdir = cos(direction)
+        self.px = self.x
+        self.py = self.y
+        self.x += self.mx + self._sindir * speed
+        self.y += -self.my + self._cosdir * speed
+
+        return created
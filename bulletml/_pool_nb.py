@@ -0,0 +1,31 @@
+"""Numba-compiled bullet pool kernels.
+
+This is the masked case of bulletml.pool.BulletPool.step_positions,
+compiled with Numba. Importing this module raises ImportError if
+Numba is not installed; bulletml.pool uses it automatically if it is.
+"""
+
+from math import sin, cos
+
+from numba import njit
+
+@njit(cache=True, boundscheck=False)
+def _step_positions_kernel(data, mask):
+    """Move the bullets in data where mask is true.
+
+    mask may be shorter than data if the pool grew since it was made.
+    """
+    x = data[0]
+    y = data[1]
+    px = data[2]
+    py = data[3]
+    mx = data[4]
+    my = data[5]
+    direction = data[6]
+    speed = data[7]
+    for i in range(mask.shape[0]):
+        if mask[i]:
+            px[i] = x[i]
+            py[i] = y[i]
+            x[i] += mx[i] + sin(direction[i]) * speed[i]
+            y[i] += cos(direction[i]) * speed[i] - my[i]
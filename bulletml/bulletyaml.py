@@ -7,7 +7,9 @@ intra-document references. Parameterless references are turned into
 direct YAML references.
 
 If PyYAML is installed, importing this module automatically registers
-BulletYAML tags with the default loader and dumper.
+BulletYAML tags with the default loader and dumper, and with Loader
+and Dumper here. Those are PyYAML's safe ones, using LibYAML if it is
+available, and are what BulletML.FromYAML uses.
 
 Example BulletYAML document:
     !BulletML
@@ -22,35 +24,45 @@ Example BulletYAML document:
 
 from bulletml import parser
 
+CLASSES = (parser.Direction, parser.ChangeDirection,
+           parser.Speed, parser.ChangeSpeed, parser.Wait,
+           parser.Tag, parser.Untag, parser.Vanish,
+           parser.Repeat, parser.Accel, parser.BulletDef,
+           parser.BulletRef, parser.ActionDef, parser.ActionRef,
+           parser.FireDef, parser.FireRef, parser.Offset,
+           parser.Appearance, parser.If, parser.BulletML)
+
+def _constructor(cls):
+    """Return a YAML constructor for a class."""
+    def construct(loader, node):
+        """Construct an object."""
+        return loader.construct_yaml_object(node, cls)
+    return construct
+
+def _representer(cls, tag):
+    """Return a YAML representer for a class."""
+    def represent(dumper, obj):
+        """Represent an object."""
+        return dumper.represent_yaml_object(tag, obj, cls)
+    return represent
+
 def register(Loader=None, Dumper=None):
     """Register BulletYAML types for a Loader and Dumper."""
-    for cls in [parser.Direction, parser.ChangeDirection,
-                parser.Speed, parser.ChangeSpeed, parser.Wait,
-                parser.Tag, parser.Untag, parser.Vanish,
-                parser.Repeat, parser.Accel, parser.BulletDef,
-                parser.BulletRef, parser.ActionDef, parser.ActionRef,
-                parser.FireDef, parser.FireRef, parser.Offset,
-                parser.Appearance, parser.If, parser.BulletML]:
-
-        def add(cls, loader, dumper):
-            """Register a class in a new variable scope."""
-            tag = "!" + cls.__name__
-            if loader:
-                def construct(loader, node):
-                    """Construct an object."""
-                    return loader.construct_yaml_object(node, cls)
-                loader.add_constructor(tag, construct)
-            if dumper:
-                def represent(dumper, obj):
-                    """Represent an object."""
-                    return dumper.represent_yaml_object(tag, obj, cls)
-                dumper.add_representer(cls, represent)
-
-        add(cls, Loader, Dumper)
+    for cls in CLASSES:
+        tag = "!" + cls.__name__
+        if Loader:
+            Loader.add_constructor(tag, _constructor(cls))
+        if Dumper:
+            Dumper.add_representer(cls, _representer(cls, tag))
 
 try:
     import yaml
 except ImportError:
     pass
 else:
+    try:
+        from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
+    except ImportError:
+        from yaml import SafeLoader as Loader, SafeDumper as Dumper
     register(yaml, yaml)
+    register(Loader, Dumper)
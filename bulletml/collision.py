@@ -5,8 +5,10 @@ shmups. It provides routines to check whether two moving circles
 collided during the past frame.
 
 An equivalent C-based version will be used automatically if it was
-compiled and installed with the module. If available, it will be noted
-in the docstrings for the functions.
+compiled and installed with the module. Otherwise, if Numba is
+installed, Numba-compiled versions of collides and collides_all_np
+are used. If available, it will be noted in the docstrings for the
+functions.
 
 Basic Usage:
 
@@ -14,10 +16,27 @@ Basic Usage:
 
     for bullet in bullets:
         if collides(player, bullet): ... # Kill the player.
+
+To check many objects against many bullets, put the bullets in a
+SpatialGrid once per frame and query it for each object.
+
+If NumPy is installed, collides_all tests all the bullets at once,
+and collides_all_np can be used directly on arrays of positions.
 """
 
 from __future__ import division
 
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Added to divisors that may be zero. It is far smaller than any
+# squared radius, so it never changes a collision result.
+EPSILON = 1e-30
+
 def overlaps(a, b):
     """Return true if two circles are overlapping.
 
@@ -30,10 +49,7 @@ def overlaps(a, b):
 
     dx = a.x - b.x
     dy = a.y - b.y
-    try:
-        radius = a.radius + b.radius
-    except AttributeError:
-        radius = getattr(a, 'radius', 0.5) + getattr(b, 'radius', 0.5)
+    radius = getattr(a, 'radius', 0.5) + getattr(b, 'radius', 0.5)
 
     return dx * dx + dy * dy <= radius * radius
 
@@ -56,20 +72,21 @@ def collides(a, b):
     yb = b.y
 
     # Treat b as a point, we only need one radius.
-    try:
-        radius = a.radius + b.radius
-    except AttributeError:
-        radius = getattr(a, 'radius', 0.5) + getattr(b, 'radius', 0.5)
+    radius = getattr(a, 'radius', 0.5) + getattr(b, 'radius', 0.5)
 
     # Previous frame locations.
-    try: pxa = a.px
-    except KeyError: pxa = xa
-    try: pya = a.py
-    except KeyError: pya = ya
-    try: pxb = b.px
-    except KeyError: pxb = xb
-    try: pyb = b.py
-    except KeyError: pyb = yb
+    pxa = getattr(a, 'px', xa)
+    pya = getattr(a, 'py', ya)
+    pxb = getattr(b, 'px', xb)
+    pyb = getattr(b, 'py', yb)
+
+    # Most pairs are far apart; reject them if the bounding boxes of
+    # their movement, grown by the radius, don't overlap.
+    if ((xa if xa > pxa else pxa) + radius < (xb if xb < pxb else pxb)
+        or (xb if xb > pxb else pxb) + radius < (xa if xa < pxa else pxa)
+        or (ya if ya > pya else pya) + radius < (yb if yb < pyb else pyb)
+        or (yb if yb > pyb else pyb) + radius < (ya if ya < pya else pya)):
+        return False
 
     # Translate b's final position to be relative to a's start.
     # And now, circle/line collision.
@@ -78,13 +95,11 @@ def collides(a, b):
 
     diff_x = pxa - pxb
     diff_y = pya - pyb
-    if (dir_x < 0.0001 and dir_x > -0.0001
-        and dir_y < 0.0001 and dir_y > -0.0001):
-        # b did not move relative to a, so do point/circle.
-        return diff_x * diff_x + diff_y * diff_y < radius * radius
 
-    # dot(diff, dir) / dot(dir, dir)
-    t = (diff_x * dir_x + diff_y * dir_y) / (dir_x * dir_x + dir_y * dir_y)
+    # dot(diff, dir) / dot(dir, dir). If b did not move relative to
+    # a, EPSILON makes t 0 and this becomes a point/circle test.
+    t = ((diff_x * dir_x + diff_y * dir_y)
+         / (dir_x * dir_x + dir_y * dir_y + EPSILON))
     if t < 0:
         t = 0
     elif t > 1:
@@ -96,17 +111,195 @@ def collides(a, b):
     # dist_sq < radius_sq
     return dist_x * dist_x + dist_y * dist_y <= radius * radius
 
+def collides_all_np(ax, ay, apx, apy, ar, bx, by, bpx, bpy, br):
+    """Return the indices of the moving circles that collide with a.
+
+    a is given as scalars, and the b arguments are equal-length NumPy
+    arrays of the other circles' current positions, previous
+    positions, and radii. This is the same test as 'collides', done
+    for every b at once.
+
+    (This function requires NumPy.)
+    """
+    # Previous and current positions as 2xN arrays.
+    b_prev = np.array((bpx, bpy), dtype=float)
+    a_prev = np.array((apx, apy), dtype=float).reshape(2, 1)
+    a_cur = np.array((ax, ay), dtype=float).reshape(2, 1)
+
+    # Translate b's final position to be relative to a's start.
+    dir = np.subtract((bx, by), a_cur)
+    dir += a_prev
+    dir -= b_prev
+    diff = np.subtract(a_prev, b_prev)
+
+    # dot(diff, dir) / dot(dir, dir); see collides.
+    denom = np.einsum('ij,ij->j', dir, dir)
+    denom += EPSILON
+    t = np.einsum('ij,ij->j', diff, dir)
+    t /= denom
+    np.clip(t, 0, 1, out=t)
+
+    dist = np.multiply(dir, t, out=dir)
+    dist -= diff
+    dist_sq = np.einsum('ij,ij->j', dist, dist)
+    radius = np.add(ar, br, dtype=float)
+    r_sq = np.multiply(radius, radius, out=radius)
+    return np.nonzero(dist_sq <= r_sq)[0]
+
 def collides_all(a, others):
     """Filter the second argument to those that collide with the first.
 
     This is equivalent to filter(lambda o: collides(a, o), others),
-    but is much faster when the compiled extension is available (which
-    it is not currently).
+    but is much faster when NumPy or the compiled extension is
+    available.
+
+    """
+    others = list(others)
+    if np is None or not others:
+        return [o for o in others if collides(a, o)]
+
+    ax = a.x
+    ay = a.y
+    n = len(others)
+    bx = np.fromiter((o.x for o in others), float, n)
+    by = np.fromiter((o.y for o in others), float, n)
+    bpx = np.fromiter((getattr(o, 'px', o.x) for o in others), float, n)
+    bpy = np.fromiter((getattr(o, 'py', o.y) for o in others), float, n)
+    br = np.fromiter((getattr(o, 'radius', 0.5) for o in others), float, n)
+    idxs = collides_all_np(
+        ax, ay, getattr(a, 'px', ax), getattr(a, 'py', ay),
+        getattr(a, 'radius', 0.5), bx, by, bpx, bpy, br)
+    return [others[i] for i in idxs]
+
+class SpatialGrid(object):
+    """Uniform grid of moving circles, for finding nearby ones quickly.
+
+    Each circle is put in every cell touched by the bounding box of
+    its movement over the past frame, grown by its radius. A query
+    returns the circles sharing a cell with the query circle's box,
+    which includes every circle that could collide with it.
+
+    Cells should be somewhat larger than the typical bullet's
+    diameter plus its distance moved per frame.
+
+    Basic Usage:
+
+        grid = SpatialGrid(16)
+        ...
+        grid.rebuild(bullets)  # Once per frame, after they move.
+        for ship in ships:
+            hits = grid.collides_all(ship)
 
     """
-    return filter(lambda o: collides(a, o), others)
+
+    def __init__(self, cell=16):
+        self.cell = cell
+        self.cells = defaultdict(list)
+        self.objects = []
+
+    def _keys(self, o):
+        """Return the cells touched by o's swept bounding box."""
+        x = o.x
+        y = o.y
+        px = getattr(o, 'px', x)
+        py = getattr(o, 'py', y)
+        radius = getattr(o, 'radius', 0.5)
+        cell = self.cell
+        x0 = int(((x if x < px else px) - radius) // cell)
+        x1 = int(((x if x > px else px) + radius) // cell)
+        y0 = int(((y if y < py else py) - radius) // cell)
+        y1 = int(((y if y > py else py) + radius) // cell)
+        return [(i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1)]
+
+    def rebuild(self, objects):
+        """Replace the grid contents with the given circles."""
+        self.objects = objects = list(objects)
+        self.cells = cells = defaultdict(list)
+        for idx, o in enumerate(objects):
+            for key in self._keys(o):
+                cells[key].append(idx)
+
+    def query(self, a):
+        """Return the circles that might collide with a.
+
+        They are returned in the order they were given to rebuild.
+        """
+        cells = self.cells
+        found = set()
+        for key in self._keys(a):
+            if key in cells:
+                found.update(cells[key])
+        objects = self.objects
+        return [objects[idx] for idx in sorted(found)]
+
+    def collides_all(self, a):
+        """Return the circles in the grid that collide with a."""
+        return collides_all(a, self.query(a))
 
 try:
     from bulletml._collision import collides, overlaps, collides_all
+    from bulletml._collision import collides_mask as _collides_mask
 except ImportError:
-    pass
+    try:
+        from bulletml._collision_nb import (
+            _collides_kernel, _collides_all_kernel)
+    except ImportError:
+        pass
+    else:
+        def collides(a, b):
+            """Return true if the two moving circles collide.
+
+            a and b should have the following attributes:
+
+            x, y - required, current position
+            px, py - not required, defaults to x, y, previous frame position
+            radius - not required, defaults to 0.5
+
+            (This function is compiled with Numba.)
+
+            """
+            xa = a.x
+            ya = a.y
+            xb = b.x
+            yb = b.y
+            return _collides_kernel(
+                xa, ya, getattr(a, 'px', xa), getattr(a, 'py', ya),
+                getattr(a, 'radius', 0.5),
+                xb, yb, getattr(b, 'px', xb), getattr(b, 'py', yb),
+                getattr(b, 'radius', 0.5))
+
+        def collides_all_np(ax, ay, apx, apy, ar, bx, by, bpx, bpy, br):
+            """Return the indices of the moving circles that collide with a.
+
+            a is given as scalars, and the b arguments are equal-length
+            NumPy arrays of the other circles' current positions,
+            previous positions, and radii. This is the same test as
+            'collides', done for every b at once.
+
+            (This function is compiled with Numba.)
+            """
+            def floats(array):
+                return np.ascontiguousarray(array, dtype=np.float64)
+            return np.nonzero(_collides_all_kernel(
+                float(ax), float(ay), float(apx), float(apy), float(ar),
+                floats(bx), floats(by), floats(bpx), floats(bpy),
+                floats(br)))[0]
+else:
+    if np is not None:
+        def collides_all_np(ax, ay, apx, apy, ar, bx, by, bpx, bpy, br):
+            """Return the indices of the moving circles that collide with a.
+
+            a is given as scalars, and the b arguments are equal-length
+            NumPy arrays of the other circles' current positions,
+            previous positions, and radii. This is the same test as
+            'collides', done for every b at once.
+
+            (This function is optimized.)
+            """
+            def floats(array):
+                return np.ascontiguousarray(array, dtype=np.float64)
+            bx = floats(bx)
+            out = np.empty(bx.shape[0], dtype=bool)
+            _collides_mask(ax, ay, apx, apy, ar, bx, floats(by),
+                           floats(bpx), floats(bpy), floats(br), out)
+            return np.nonzero(out)[0]
@@ -6,9 +6,12 @@ http://www.asahi-net.or.jp/~cs8k-cyu/bulletml/index_e.html
 # BulletML assumes 1/2 = 0.5.
 from __future__ import division
 
+import ast
 import random
 import re
 
+from functools import lru_cache
+
 from bulletml.errors import Error
 
 __all__ = ["ExprError", "NumberDef", "INumberDef"]
@@ -17,6 +20,107 @@ class ExprError(Error):
     """Raised when an invalid expression is evaluated/compiled."""
     pass
 
+PARAM = re.compile(r"\$\d+")
+
+def _param_index(match):
+    return "params[%d]" % (int(match.group()[1:]) - 1)
+
+def _constant(node):
+    """Return the value of a numeric AST subtree without variables.
+
+    Returns None if it has variables or calls, or isn't a number.
+    """
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Name, ast.Call, ast.Subscript)):
+            return None
+    try:
+        value = eval(compile(ast.Expression(node), "<expr>", "eval"),
+                     dict(__builtins__={}))
+    except Exception:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+def _is_random(node):
+    return (isinstance(node, ast.Call) and not node.args
+            and isinstance(node.func, ast.Name) and node.func.id == "random")
+
+def _random_scale(node):
+    """Return b if node is b * random() or random() * b, else None."""
+    if _is_random(node):
+        return 1
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+        if _is_random(node.right):
+            return _constant(node.left)
+        elif _is_random(node.left):
+            return _constant(node.right)
+    return None
+
+def _random_form(expr):
+    """Match expr against a + b * random() and similar forms.
+
+    Returns (a, b), or None if it doesn't match. Subtraction is
+    handled by negating a or b, which gives the same floating-point
+    result.
+    """
+    node = ast.parse(expr, mode="eval").body
+    b = _random_scale(node)
+    if b is not None:
+        return (0, b)
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        sign = 1 if isinstance(node.op, ast.Add) else -1
+        a = _constant(node.left)
+        b = _random_scale(node.right)
+        if a is not None and b is not None:
+            return (a, sign * b)
+        a = _constant(node.right)
+        b = _random_scale(node.left)
+        if a is not None and b is not None:
+            return (sign * a, b)
+    return None
+
+@lru_cache(maxsize=4096)
+def _compile_expr(expr):
+    """Translate and compile a BulletML expression string.
+
+    Returns a (function, value, form) tuple. function takes (params,
+    rank) and returns the expression's value. value is the constant
+    value of the expression, or None if it depends on parameters,
+    rank, or $rand. form is an (a, b) pair if the expression is a +
+    b * $rand (see _random_form), otherwise None. Identical
+    expressions share the same function.
+    """
+    if "__" in expr:
+        # nedbatchelder.com/blog/201206/eval_really_is_dangerous.html
+        raise ExprError(expr)
+    expr = PARAM.sub(_param_index, expr.lower())
+    expr = expr.replace("$rand", "random()").replace("$rank", "rank")
+    try:
+        try:
+            value = eval(expr, dict(__builtins__={}))
+        except NameError:
+            variables = dict(rank=1, params=[0] * 99)
+            value = eval(expr, NumberDef.GLOBALS, variables)
+            if not isinstance(value, (int, float)):
+                raise TypeError(expr)
+            value = None
+    except Exception:
+        raise ExprError(expr)
+    form = None if value is not None else _random_form(expr)
+    function = eval("lambda params, rank: " + expr, NumberDef.GLOBALS)
+    return function, value, form
+
+@lru_cache(maxsize=4096)
+def _instance(cls, expr):
+    """Return the shared instance for expr, set up and validated.
+
+    Invalid expressions raise before anything is cached.
+    """
+    self = object.__new__(cls)
+    self.__init__(expr)
+    return self
+
 class NumberDef(object):
     """BulletML numeric expression.
 
@@ -29,47 +133,40 @@ class NumberDef(object):
     180-$rank*20
     (2+$1)*0.3
 
+    NumberDefs can't be changed once made, so constructing one for an
+    expression that already has one returns the existing instance.
+
     """
 
     GLOBALS = dict(random=random.random, __builtins__={})
 
+    def __new__(cls, expr=None):
+        if expr is None:
+            # Being copied or unpickled.
+            return object.__new__(cls)
+        return _instance(cls, str(getattr(expr, "string", expr)))
+
     def __init__(self, expr):
+        if "expr" in self.__dict__:
+            # Shared instance, already set up.
+            return
         try:
             expr = expr.string
         except AttributeError:
             pass
-        try:
-            if "__" in expr:
-                # nedbatchelder.com/blog/201206/eval_really_is_dangerous.html
-                raise ExprError(expr)
-        except TypeError:
-            pass
         self.string = expr = str(expr)
-        repl = lambda match: "params[%d]" % (int(match.group()[1:]) - 1)
-        expr = re.sub(r"\$\d+", repl, expr.lower())
-        self.__expr = expr.replace("$rand", "random()").replace("$rank", "rank")
-        try:
-            try:
-                self._value = eval(self.__expr, dict(__builtins__={}))
-            except NameError:
-                variables = dict(rank=1, params=[0] * 99)
-                value = eval(self.__expr, self.GLOBALS, variables)
-                if not isinstance(value, (int, float)):
-                    raise TypeError(expr)
-                self._value = None
-                self.expr = self.string
-            else:
-                self.expr = self._value
-        except Exception:
-            raise ExprError(expr)
-        self.__expr = compile(self.__expr, __file__, "eval")
+        self._call, self._value, form = _compile_expr(expr)
+        self.expr = self.string if self._value is None else self._value
+        if self._value is not None:
+            # Constants skip evaluation entirely; see _ConstNumberDef.
+            self.__class__ = _CONSTANT.get(type(self), type(self))
+        elif form is not None:
+            self._a, self._b = form
+            self.__class__ = _RANDOM.get(type(self), type(self))
 
     def __call__(self, params, rank):
         """Evaluate the expression and return its value."""
-        if self._value is not None:
-            return self._value
-        variables = { 'rank': rank, 'params': params }
-        return eval(self.__expr, self.GLOBALS, variables)
+        return self._call(params, rank)
 
     def __repr__(self):
         return "%s(%r)" % (type(self).__name__, self.expr)
@@ -82,7 +179,48 @@ class INumberDef(NumberDef):
             self._value = int(round(self._value))
 
     def __call__(self, params, rank):
-        # Avoid int(round(__call__())) overhead for constants.
-        if self._value is not None:
-            return self._value
         return int(round(super(INumberDef, self).__call__(params, rank)))
+
+class _ConstNumberDef(NumberDef):
+    """A NumberDef with a constant value.
+
+    NumberDef instances turn into this class when their expression
+    has no variables, so calling them is just an attribute load.
+    """
+
+    def __call__(self, params, rank):
+        return self._value
+
+    def __repr__(self):
+        return "%s(%r)" % (NumberDef.__name__, self.expr)
+
+class _ConstINumberDef(INumberDef):
+    """An INumberDef with a constant, pre-rounded value."""
+
+    def __call__(self, params, rank):
+        return self._value
+
+    def __repr__(self):
+        return "%s(%r)" % (INumberDef.__name__, self.expr)
+
+class _RandNumberDef(NumberDef):
+    """A NumberDef of the form a + b * $rand, computed without eval."""
+
+    def __call__(self, params, rank):
+        return self._a + self._b * _random()
+
+    def __repr__(self):
+        return "%s(%r)" % (NumberDef.__name__, self.expr)
+
+class _RandINumberDef(INumberDef):
+    """An INumberDef of the form a + b * $rand, computed without eval."""
+
+    def __call__(self, params, rank):
+        return int(round(self._a + self._b * _random()))
+
+    def __repr__(self):
+        return "%s(%r)" % (INumberDef.__name__, self.expr)
+
+_random = random.random
+_CONSTANT = {NumberDef: _ConstNumberDef, INumberDef: _ConstINumberDef}
+_RANDOM = {NumberDef: _RandNumberDef, INumberDef: _RandINumberDef}
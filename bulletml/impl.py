@@ -4,7 +4,34 @@ from __future__ import division
 
 from math import atan2, sin, cos
 
-__all__ = ["Action", "Bullet"]
+__all__ = ["Action", "Bullet", "compile_actions"]
+
+# Opcodes for compiled action lists.
+OP_CALL = 0 # Call operand(owner, action, params, rank, created).
+OP_WAIT = 1 # Wait for operand(params, rank) frames.
+
+def compile_actions(actions):
+    """Compile an action list into a tuple of (opcode, operand) pairs.
+
+    Actions with a compile method are asked for their own pair;
+    everything else is called normally.
+    """
+    # Nested actions (action, actionRef, repeat) stay as calls rather
+    # than being inlined into one program for the whole document.
+    # Each runs in its own Action with its own parameters and repeat
+    # count, user Action subclasses see those frames, and running
+    # actions resume at their pc each frame rather than walking the
+    # tree again, so inlining would save little. The operands are
+    # Python callables, so it couldn't run under Numba either.
+    code = []
+    for action in actions:
+        try:
+            compile = action.compile
+        except AttributeError:
+            code.append((OP_CALL, action))
+        else:
+            code.append(compile())
+    return tuple(code)
 
 class Action(object):
     """Running action implementation.
@@ -19,9 +46,22 @@ class Action(object):
     owner, action, and created in-place, and return true if action
     execution should stop for this bullet this frame.
 
+    The actions an Action runs are compiled by compile_actions, and
+    its actions attribute holds the compiled (opcode, operand) pairs.
+    A list of action objects is compiled when the Action is made.
+    Common actions can also provide a compile method returning an
+    (opcode, operand) pair, which step handles without calling them.
+
     """
 
+    __slots__ = ("actions", "parent", "repeat", "wait_frames", "speed",
+                 "speed_frames", "direction", "direction_frames", "aiming",
+                 "mx", "my", "accel_frames", "previous_fire_direction",
+                 "previous_fire_speed", "params", "pc", "finished")
+
     def __init__(self, parent, actions, params, rank, repeat=1):
+        if actions and not isinstance(actions[0], tuple):
+            actions = compile_actions(actions)
         self.actions = actions
         self.parent = parent
         self.repeat = repeat
@@ -69,6 +109,11 @@ class Action(object):
     def step(self, owner, created):
         """Advance by one frame."""
 
+        # Finished actions with no changes left in progress do nothing.
+        if (self.pc is None and self.speed_frames <= 0
+            and self.direction_frames <= 0 and self.accel_frames <= 0):
+            return
+
         if self.speed_frames > 0:
             self.speed_frames -= 1
             owner.speed += self.speed
@@ -95,13 +140,14 @@ class Action(object):
 
         s_params = self.params
         rank = owner.rank
+        code = self.actions
+        n = len(code)
+        pc = self.pc
 
         while True:
-            self.pc += 1
+            pc += 1
 
-            try:
-                action = self.actions[self.pc]
-            except IndexError:
+            if pc >= n:
                 self.repeat -= 1
                 if self.repeat <= 0:
                     self.pc = None
@@ -111,10 +157,17 @@ class Action(object):
                         owner.replace(self, self.parent)
                     break
                 else:
-                    self.pc = 0
-                    action = self.actions[self.pc]
-
-            if action(owner, self, s_params, rank, created):
+                    pc = -1
+                    continue
+
+            # Actions may read or reset pc (e.g. vanishing), so
+            # store it before running them.
+            self.pc = pc
+            op, arg = code[pc]
+            if op == OP_WAIT:
+                self.wait_frames = arg(s_params, rank)
+                break
+            elif arg(owner, self, s_params, rank, created):
                 break
 
 class Bullet(object):
@@ -140,8 +193,15 @@ class Bullet(object):
     actions - internal action list
     Action - custom Action constructor
 
+    Subclasses that add their own attributes get a __dict__ as usual.
+
     """
 
+    __slots__ = ("x", "y", "px", "py", "mx", "my", "direction", "speed",
+                 "vanished", "finished", "target", "rank", "tags",
+                 "appearance", "actions", "radius",
+                 "_trigdir", "_sindir", "_cosdir", "_aim", "_stepping")
+
     def __init__(self, x=0, y=0, direction=0, speed=0, target=None,
                  actions=(), rank=0.5, tags=(), appearance=None,
                  radius=0.5):
@@ -151,6 +211,12 @@ class Bullet(object):
         self.mx = 0
         self.my = 0
         self.direction = direction
+        # Many bullets change direction before they first move, so
+        # don't compute sin/cos until then.
+        self._trigdir = None
+        self._sindir = self._cosdir = 0
+        self._aim = None
+        self._stepping = False
         self.speed = speed
         self.vanished = False
         self.finished = False
@@ -164,6 +230,9 @@ class Bullet(object):
     def FromDocument(cls, doc, x=0, y=0, direction=0, speed=0, target=None,
                      params=(), rank=0.5, Action=Action):
         """Construct a new Bullet from a loaded BulletML document."""
+        # Actions are built fresh rather than copied from a cached
+        # template; it's cheaper than copying, and parameters may use
+        # $rand, so they must be evaluated for each bullet.
         actions = [action(None, Action, params, rank)
                    for action in doc.actions]
         return cls(x=x, y=y, direction=direction, speed=speed,
@@ -181,14 +250,21 @@ class Bullet(object):
         """Angle to the target, in radians.
 
         If the target does not exist or cannot be found, return 0.
+
+        Neither the bullet nor its target move while its actions run,
+        so during step the angle is only computed once.
         """
+        if self._aim is not None:
+            return self._aim
         try:
             target_x = self.target.x
             target_y = self.target.y
         except AttributeError:
             return 0
-        else:
-            return atan2(target_x - self.x, target_y - self.y)
+        aim = atan2(target_x - self.x, target_y - self.y)
+        if self._stepping:
+            self._aim = aim
+        return aim
 
     def vanish(self):
         """Vanish this bullet and stop all actions."""
@@ -220,9 +296,12 @@ class Bullet(object):
         created = []
 
         finished = self.vanished
+        self._stepping = True
         for action in self.actions:
             action.step(self, created)
             finished = finished and action.finished
+        self._stepping = False
+        self._aim = None
         if finished:
             for action in self.actions:
                 finished = finished and action.finished
@@ -230,9 +309,19 @@ class Bullet(object):
 
         speed = self.speed
         direction = self.direction
+        # Direction usually stays the same for many frames.
+        if direction != self._trigdir:
+            self._trigdir = direction
+            self._sindir = sin(direction)
+            self._cosdir = cos(direction)
         self.px = self.x
         self.py = self.y
-        self.x += self.mx + sin(direction) * speed
-        self.y += -self.my + cos(direction) * speed
+        self.x += self.mx + self._sindir * speed
+        self.y += -self.my + self._cosdir * speed
 
         return created
+
+try:
+    from bulletml._impl import Action, Bullet
+except ImportError:
+    pass
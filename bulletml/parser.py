@@ -11,7 +11,21 @@ from __future__ import division
 
 from math import sin, cos, radians, pi as PI
 
-from xml.etree.ElementTree import ElementTree
+try:
+    from math import remainder
+except ImportError:
+    # Python < 3.7. Only used for directions, where this gives the
+    # same result (with -pi rather than pi for ties).
+    def remainder(x, y):
+        return (x + y / 2) % y - y / 2
+
+# Python 2's pure-Python ElementTree is much slower than the C one.
+# lxml isn't used; it returns comments as children, which every
+# FromXML would then have to skip.
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
 
 # Python 3 moved this for no really good reason.
 try:
@@ -19,6 +33,8 @@ try:
 except ImportError:
     pass
 
+from io import BytesIO
+
 try:
     from io import StringIO
 except ImportError:
@@ -29,28 +45,65 @@ except ImportError:
 
 from bulletml.errors import Error
 from bulletml.expr import NumberDef, INumberDef
+from bulletml.impl import OP_WAIT, compile_actions
 
 
 __all__ = ["ParseError", "BulletML"]
 
 PI_2 = PI * 2
+# Same as math.radians, but without the call.
+DEG_TO_RAD = PI / 180
+
+# Direction, speed, and offset types, as passed to actions. Numbers
+# compare faster than strings.
+RELATIVE, ABSOLUTE, AIM, SEQUENCE = range(4)
+TYPE_IDS = dict(relative=RELATIVE, absolute=ABSOLUTE, aim=AIM,
+                sequence=SEQUENCE)
 
 class ParseError(Error):
     """Raised when an error occurs parsing the XML structure."""
     pass
 
+def _resolve(table, label, kind):
+    """Look up a labelled definition, or raise ParseError."""
+    definition = table.get(label)
+    if definition is None:
+        raise ParseError("unknown %s reference %r" % (kind, label))
+    return definition
+
+# Documents use only a few distinct tags, so remember stripped ones.
+# They're interned so comparing them to the literal tag names in the
+# FromXML methods is an identity check.
+_TAGS = {}
+
 def realtag(element):
     """Strip namespace poop off the front of a tag."""
+    tag = element.tag
     try:
-        return element.tag.rsplit('}', 1)[1]
-    except ValueError:
-        return element.tag
+        return _TAGS[tag]
+    except KeyError:
+        real = _TAGS[tag] = intern(tag.rpartition('}')[2])
+        return real
+
+def _label(element):
+    """Return an element's label, interned so lookups are cheaper."""
+    label = element.get("label")
+    return label if label is None else intern(label)
 
 class ParamList(object):
-    """List of parameter definitions."""
+    """List of parameter definitions.
+
+    If every parameter is constant (or there are none), calling it
+    returns the same tuple of values each time.
+    """
+
+    __slots__ = ("params", "_constant")
 
     def __init__(self, params=()):
         self.params = list(params)
+        values = tuple(getattr(param, "_value", None)
+                       for param in self.params)
+        self._constant = None if None in values else values
 
     @classmethod
     def FromXML(cls, doc, element):
@@ -59,6 +112,8 @@ class ParamList(object):
                     if realtag(subelem) == "param"])
 
     def __call__(self, params, rank):
+        if self._constant is not None:
+            return self._constant
         return [param(params, rank) for param in self.params]
 
     def __repr__(self):
@@ -67,13 +122,22 @@ class ParamList(object):
 class Direction(object):
     """Raw direction value."""
 
+    __slots__ = ("type", "type_id", "value", "_constant")
+
     VALID_TYPES = ["relative", "absolute", "aim", "sequence"]
 
     def __init__(self, type, value):
         if type not in self.VALID_TYPES:
             raise ValueError("invalid type %r" % type)
         self.type = intern(type)
+        self.type_id = TYPE_IDS[type]
         self.value = value
+        # Constant directions are converted to radians only once.
+        constant = getattr(value, "_value", None)
+        if constant is not None:
+            self._constant = (radians(constant), self.type_id)
+        else:
+            self._constant = None
 
     def __getstate__(self):
         return [('type', self.type), ('value', self.value.expr)]
@@ -88,7 +152,9 @@ class Direction(object):
         return cls(element.get("type", default), NumberDef(element.text))
 
     def __call__(self, params, rank):
-        return (radians(self.value(params, rank)), self.type)
+        if self._constant is not None:
+            return self._constant
+        return (self.value(params, rank) * DEG_TO_RAD, self.type_id)
 
     def __repr__(self):
         return "%s(%r, type=%r)" % (
@@ -97,6 +163,8 @@ class Direction(object):
 class ChangeDirection(object):
     """Direction change over time."""
 
+    __slots__ = ("term", "direction")
+
     def __init__(self, term, direction):
         self.term = term
         self.direction = direction
@@ -114,33 +182,38 @@ class ChangeDirection(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        for subelem in list(element):
+        term = None
+        direction = None
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "direction":
                 direction = Direction.FromXML(doc, subelem)
             elif tag == "term":
                 term = INumberDef(subelem.text)
-        try:
-            return cls(term, direction)
-        except UnboundLocalError as exc:
-            raise ParseError(str(exc))
+        if term is None or direction is None:
+            raise ParseError("changeDirection needs term and direction")
+        return cls(term, direction)
 
-    def __call__(self, owner, action, params, rank, created):
+    def __call__(self, owner, action, params, rank, created,
+                 _remainder=remainder, _PI=PI, _PI2=PI_2):
+        # The defaults make these local lookups rather than global.
         frames = self.term(params, rank)
         direction, type = self.direction(params, rank)
         action.direction_frames = frames
         action.aiming = False
-        if type == "sequence":
+        if type == SEQUENCE:
             action.direction = direction
         else:
-            if type == "absolute":
+            if type == ABSOLUTE:
                 direction -= owner.direction
-            elif type != "relative": # aim or default
+            elif type != RELATIVE: # aim or default
                 action.aiming = True
                 direction += owner.aim - owner.direction
 
             # Normalize to [-pi, pi).
-            direction = (direction + PI) % PI_2 - PI
+            direction = _remainder(direction, _PI2)
+            if direction == _PI:
+                direction = -_PI
             if frames <= 0:
                 owner.direction += direction
             else:
@@ -153,13 +226,21 @@ class ChangeDirection(object):
 class Speed(object):
     """Raw speed value."""
 
+    __slots__ = ("type", "type_id", "value", "_constant")
+
     VALID_TYPES = ["relative", "absolute", "sequence"]
 
     def __init__(self, type, value):
         if type not in self.VALID_TYPES:
             raise ValueError("invalid type %r" % type)
         self.type = intern(type)
+        self.type_id = TYPE_IDS[type]
         self.value = value
+        constant = getattr(value, "_value", None)
+        if constant is not None:
+            self._constant = (constant, self.type_id)
+        else:
+            self._constant = None
 
     def __getstate__(self):
         return [('type', self.type), ('value', self.value.expr)]
@@ -174,7 +255,9 @@ class Speed(object):
         return cls(element.get("type", "absolute"), NumberDef(element.text))
 
     def __call__(self, params, rank):
-        return (self.value(params, rank), self.type)
+        if self._constant is not None:
+            return self._constant
+        return (self.value(params, rank), self.type_id)
 
     def __repr__(self):
         return "%s(%r, type=%r)" % (type(self).__name__, self.value, self.type)
@@ -182,6 +265,8 @@ class Speed(object):
 class ChangeSpeed(object):
     """Speed change over time."""
 
+    __slots__ = ("term", "speed")
+
     def __init__(self, term, speed):
         self.term = term
         self.speed = speed
@@ -199,29 +284,30 @@ class ChangeSpeed(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        for subelem in list(element):
+        term = None
+        speed = None
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "speed":
                 speed = Speed.FromXML(doc, subelem)
             elif tag == "term":
                 term = INumberDef(subelem.text)
-        try:
-            return cls(term, speed)
-        except UnboundLocalError as exc:
-            raise ParseError(str(exc))
+        if term is None or speed is None:
+            raise ParseError("changeSpeed needs term and speed")
+        return cls(term, speed)
 
     def __call__(self, owner, action, params, rank, created):
         frames = self.term(params, rank)
         speed, type = self.speed(params, rank)
         action.speed_frames = frames
         if frames <= 0:
-            if type == "absolute":
+            if type == ABSOLUTE:
                 owner.speed = speed
-            elif type == "relative":
+            elif type == RELATIVE:
                 owner.speed += speed
-        elif type == "sequence":
+        elif type == SEQUENCE:
             action.speed = speed
-        elif type == "relative":
+        elif type == RELATIVE:
             action.speed = speed / frames
         else:
             action.speed = (speed - owner.speed) / frames
@@ -233,6 +319,8 @@ class ChangeSpeed(object):
 class Wait(object):
     """Wait for some frames."""
 
+    __slots__ = ("frames",)
+
     def __init__(self, frames):
         self.frames = frames
 
@@ -251,14 +339,19 @@ class Wait(object):
         action.wait_frames = self.frames(params, rank)
         return True
 
+    def compile(self):
+        return (OP_WAIT, self.frames)
+
     def __repr__(self):
         return "%s(%r)" % (type(self).__name__, self.frames)
 
 class Tag(object):
     """Set a bullet tag."""
 
+    __slots__ = ("tag",)
+
     def __init__(self, tag):
-        self.tag = tag
+        self.tag = tag if tag is None else intern(tag)
 
     def __getstate__(self):
         return dict(tag=self.tag)
@@ -277,9 +370,11 @@ class Tag(object):
 class Untag(object):
     """Unset a bullet tag."""
 
+    __slots__ = ("tag",)
+
     def __init__(self, tag):
-        self.tag = tag
-        
+        self.tag = tag if tag is None else intern(tag)
+
     def __getstate__(self):
         return dict(tag=self.tag)
 
@@ -292,14 +387,13 @@ class Untag(object):
         return cls(element.text)
 
     def __call__(self, owner, action, params, rank, created):
-        try:
-            owner.tags.remove(self.tag)
-        except KeyError:
-            pass
+        owner.tags.discard(self.tag)
 
 class Appearance(object):
     """Set a bullet appearance."""
 
+    __slots__ = ("appearance",)
+
     def __init__(self, appearance):
         self.appearance = appearance
 
@@ -315,14 +409,24 @@ class Appearance(object):
         return cls(element.text)
 
     def __call__(self, owner, action, params, rank, created):
-        owner.apearance = self.appearance
+        owner.appearance = self.appearance
 
 class Vanish(object):
     """Make the owner disappear."""
 
+    __slots__ = ()
+
     def __init__(self):
         pass
 
+    def __getstate__(self):
+        # YAML needs a mapping. The default is None on Python 3.11+,
+        # and there's no __dict__ to fall back to before that.
+        return dict()
+
+    def __setstate__(self, state):
+        self.__init__()
+
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
@@ -338,6 +442,8 @@ class Vanish(object):
 class Repeat(object):
     """Repeat an action definition."""
 
+    __slots__ = ("times", "action")
+
     def __init__(self, times, action):
         self.times = times
         self.action = action
@@ -352,7 +458,9 @@ class Repeat(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        for subelem in list(element):
+        times = None
+        action = None
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "times":
                 times = INumberDef(subelem.text)
@@ -360,12 +468,15 @@ class Repeat(object):
                 action = ActionDef.FromXML(doc, subelem)
             elif tag == "actionRef":
                 action = ActionRef.FromXML(doc, subelem)
-        try:
-            return cls(times, action)
-        except UnboundLocalError as exc:
-            raise ParseError(str(exc))
+        if times is None or action is None:
+            raise ParseError("repeat needs times and an action")
+        return cls(times, action)
 
     def __call__(self, owner, action, params, rank, created):
+        # Repeated fires aren't batched. Each bullet needs its own
+        # object and actions anyway, expressions may use $rand in
+        # order, and fired bullets don't compute sin/cos until they
+        # move, so there's little left to vectorize.
         repeat = self.times(params, rank)
         return self.action(owner, action, params, rank, created, repeat)
 
@@ -375,6 +486,8 @@ class Repeat(object):
 class If(object):
     """Conditional actions."""
 
+    __slots__ = ("cond", "then", "else_")
+
     def __init__(self, cond, then, else_=None):
         self.cond = cond
         self.then = then
@@ -397,8 +510,10 @@ class If(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
+        cond = None
+        then = None
         else_ = None
-        for subelem in list(element):
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "cond":
                 cond = INumberDef(subelem.text)
@@ -406,10 +521,9 @@ class If(object):
                 then = ActionDef.FromXML(doc, subelem)
             elif tag == "else":
                 else_ = ActionDef.FromXML(doc, subelem)
-        try:
-            return cls(cond, then, else_)
-        except UnboundLocalError as exc:
-            raise ParseError(str(exc))
+        if cond is None or then is None:
+            raise ParseError("if needs cond and then")
+        return cls(cond, then, else_)
 
     def __call__(self, owner, action, params, rank, created):
         if self.cond(params, rank):
@@ -431,8 +545,7 @@ class If(object):
 class Accel(object):
     """Accelerate over some time."""
 
-    horizontal = None
-    vertical = None
+    __slots__ = ("term", "horizontal", "vertical")
 
     def __init__(self, term, horizontal=None, vertical=None):
         self.term = term
@@ -455,10 +568,11 @@ class Accel(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
+        term = None
         horizontal = None
         vertical = None
 
-        for subelem in list(element):
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "term":
                 term = INumberDef(subelem.text)
@@ -467,10 +581,9 @@ class Accel(object):
             elif tag == "vertical":
                 vertical = Speed.FromXML(doc, subelem)
 
-        try:
-            return cls(term, horizontal, vertical)
-        except AttributeError:
-            raise ParseError
+        if term is None:
+            raise ParseError("accel needs term")
+        return cls(term, horizontal, vertical)
 
     def __call__(self, owner, action, params, rank, created):
         frames = self.term(params, rank)
@@ -480,28 +593,28 @@ class Accel(object):
         if horizontal:
             mx, type = horizontal
             if frames <= 0:
-                if type == "absolute":
+                if type == ABSOLUTE:
                     owner.mx = mx
-                elif type == "relative":
+                elif type == RELATIVE:
                     owner.mx += mx
-            elif type == "sequence":
+            elif type == SEQUENCE:
                 action.mx = mx
-            elif type == "absolute":
+            elif type == ABSOLUTE:
                 action.mx = (mx - owner.mx) / frames
-            elif type == "relative":
+            elif type == RELATIVE:
                 action.mx = mx / frames
         if vertical:
             my, type = vertical
             if frames <= 0:
-                if type == "absolute":
+                if type == ABSOLUTE:
                     owner.my = my
-                elif type == "relative":
+                elif type == RELATIVE:
                     owner.my += my
-            elif type == "sequence":
+            elif type == SEQUENCE:
                 action.my = my
-            elif type == "absolute":
+            elif type == ABSOLUTE:
                 action.my = (my - owner.my) / frames
-            elif type == "relative":
+            elif type == RELATIVE:
                 action.my = my / frames
 
     def __repr__(self):
@@ -511,6 +624,8 @@ class Accel(object):
 class BulletDef(object):
     """Bullet definition."""
 
+    __slots__ = ("direction", "speed", "actions", "tags", "appearance")
+
     def __init__(self, actions=(), direction=None, speed=None, tags=(),
                  appearance=None):
         self.direction = direction
@@ -544,7 +659,7 @@ class BulletDef(object):
         speed = None
         direction = None
         tags = set()
-        for subelem in list(element):
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "direction":
                 direction = Direction.FromXML(doc, subelem)
@@ -557,12 +672,20 @@ class BulletDef(object):
             elif tag == "tag":
                 tags.add(subelem.text)
         dfn = cls(actions, direction, speed, tags)
-        doc._bullets[element.get("label")] = dfn
+        doc._bullets[_label(element)] = dfn
         return dfn
 
     def __call__(self, owner, action, params, rank, created):
-        actions = [a(None, action, params, rank, created)
-                   for a in self.actions]
+        actions = self.actions
+        if not actions:
+            # Bullets copy their actions, so this can be shared.
+            actions = ()
+        elif len(actions) == 1:
+            # The usual case; skip building a comprehension.
+            actions = [actions[0](None, action, params, rank, created)]
+        else:
+            actions = [a(None, action, params, rank, created)
+                       for a in actions]
         return (
             self.direction and self.direction(params, rank),
             self.speed and self.speed(params, rank),
@@ -577,6 +700,8 @@ class BulletDef(object):
 class BulletRef(object):
     """Create a bullet by name with parameters."""
 
+    __slots__ = ("bullet", "params")
+
     def __init__(self, bullet, params=None):
         self.bullet = bullet
         self.params = ParamList() if params is None else params
@@ -598,7 +723,7 @@ class BulletRef(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        bullet = cls(element.get("label"), ParamList.FromXML(doc, element))
+        bullet = cls(_label(element), ParamList.FromXML(doc, element))
         doc._bullet_refs.append(bullet)
         return bullet
 
@@ -617,14 +742,41 @@ class ActionDef(object):
     ActionDef.CONSTRUCTORS. It maps tag names to classes with a
     FromXML classmethod, which take the BulletML instance and
     ElementTree element as arguments.
+
+    The actions are compiled for bulletml.impl.Action when first run.
+    Assigning a new list to actions recompiles them; call
+    invalidate() after changing the list in place.
     """
 
+    __slots__ = ("_actions", "_code")
+
     # This is self-referential, so it's filled in later.
     CONSTRUCTORS = dict()
 
     def __init__(self, actions):
         self.actions = list(actions)
 
+    @property
+    def actions(self):
+        return self._actions
+
+    @actions.setter
+    def actions(self, actions):
+        self._actions = actions
+        self._code = None
+
+    @property
+    def code(self):
+        """The actions, compiled by bulletml.impl.compile_actions."""
+        code = self._code
+        if code is None:
+            code = self._code = compile_actions(self._actions)
+        return code
+
+    def invalidate(self):
+        """Recompile the actions the next time they run."""
+        self._code = None
+
     def __getstate__(self):
         return dict(actions=self.actions)
 
@@ -636,22 +788,26 @@ class ActionDef(object):
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
         actions = []
-        for subelem in list(element):
-            tag = realtag(subelem)
-            try:
-                ctr = cls.CONSTRUCTORS[tag]
-            except KeyError:
-                continue
-            else:
-                actions.append(ctr.FromXML(doc, subelem))
+        constructors = cls.CONSTRUCTORS
+        for subelem in element:
+            ctr = constructors.get(realtag(subelem))
+            if ctr is not None:
+                action = ctr.FromXML(doc, subelem)
+                if type(action) in SHARED:
+                    action = doc._shared.setdefault(
+                        _share_key(action), action)
+                actions.append(action)
         dfn = cls(actions)
-        doc._actions[element.get("label")] = dfn
+        label = _label(element)
+        doc._actions[label] = dfn
+        if label and label.startswith("top"):
+            doc._top_actions[label] = dfn
         return dfn
 
     def __call__(self, owner, action, params, rank, created=(), repeat=1):
         Action = action if isinstance(action, type) else type(action) 
         parent = None if owner is None else action
-        child = Action(parent, self.actions, params, rank, repeat)
+        child = Action(parent, self.code, params, rank, repeat)
         if owner is not None:
             owner.replace(parent, child)
             child.step(owner, created)
@@ -663,6 +819,8 @@ class ActionDef(object):
 class ActionRef(object):
     """Run an action by name with parameters."""
 
+    __slots__ = ("action", "params")
+
     def __init__(self, action, params=None):
         self.action = action
         self.params = params or ParamList()
@@ -684,7 +842,7 @@ class ActionRef(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        action = cls(element.get("label"), ParamList.FromXML(doc, element))
+        action = cls(_label(element), ParamList.FromXML(doc, element))
         doc._action_refs.append(action)
         return action
 
@@ -699,14 +857,24 @@ class ActionRef(object):
 class Offset(object):
     """Provide an offset to a bullet's initial position."""
 
+    __slots__ = ("type", "type_id", "x", "y", "_constant")
+
     VALID_TYPES = ["relative", "absolute"]
 
     def __init__(self, type, x, y):
         if type not in self.VALID_TYPES:
             raise ValueError("invalid type %r" % type)
         self.type = intern(type)
+        self.type_id = TYPE_IDS[type]
         self.x = x
         self.y = y
+        # Most offsets are fixed, e.g. a gun's position on a ship.
+        const_x = getattr(x, "_value", None) if x else 0
+        const_y = getattr(y, "_value", None) if y else 0
+        if const_x is not None and const_y is not None:
+            self._constant = (const_x, const_y)
+        else:
+            self._constant = None
 
     def __getstate__(self):
         state = [('type', self.type)]
@@ -737,12 +905,17 @@ class Offset(object):
         return cls(type, x, y)
 
     def __call__(self, params, rank):
+        if self._constant is not None:
+            return self._constant
         return (self.x(params, rank) if self.x else 0,
                 self.y(params, rank) if self.y else 0)
 
 class FireDef(object):
     """Fire definition (creates a bullet)."""
 
+    __slots__ = ("bullet", "direction", "speed", "offset", "tags",
+                 "appearance")
+
     def __init__(self, bullet, direction=None, speed=None, offset=None,
                  tags=(), appearance=None):
         self.bullet = bullet
@@ -783,13 +956,14 @@ class FireDef(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
+        bullet = None
         direction = None
         speed = None
         offset = None
         tags = set()
         appearance = None
 
-        for subelem in list(element):
+        for subelem in element:
             tag = realtag(subelem)
             if tag == "direction":
                 direction = Direction.FromXML(doc, subelem, "aim")
@@ -805,32 +979,34 @@ class FireDef(object):
                 tags.add(subelem.text)
             elif tag == "appearance":
                 appearance = subelem.text
-        try:
-            fire = cls(bullet, direction, speed, offset, tags, appearance)
-        except UnboundLocalError as exc:
-            raise ParseError(str(exc))
-        else:
-            doc._fires[element.get("label")] = fire
-            return fire
-
-    def __call__(self, owner, action, params, rank, created):
+        if bullet is None:
+            raise ParseError("fire needs a bullet or bulletRef")
+        fire = cls(bullet, direction, speed, offset, tags, appearance)
+        doc._fires[_label(element)] = fire
+        return fire
+
+    def __call__(self, owner, action, params, rank, created,
+                 _sin=sin, _cos=cos):
+        # The defaults make these local lookups rather than global.
         direction, speed, tags, appearance, actions = self.bullet(
             owner, action, params, rank, created)
         if self.direction is not None:
             direction = self.direction(params, rank)
         if self.speed is not None:
             speed = self.speed(params, rank)
-        tags = tags.union(self.tags)
+        # Bullets copy their tags, so only make a new set when adding.
+        if self.tags:
+            tags = tags.union(self.tags)
         if self.appearance is not None:
             appearance = self.appearance
 
         if direction is not None:
             direction, type = direction
-            if type == "aim" or type is None:
+            if type == AIM or type is None:
                 direction += owner.aim
-            elif type == "sequence":
+            elif type == SEQUENCE:
                 direction += action.previous_fire_direction
-            elif type == "relative":
+            elif type == RELATIVE:
                 direction += owner.direction
         else:
             direction = owner.aim
@@ -838,9 +1014,9 @@ class FireDef(object):
 
         if speed is not None:
             speed, type = speed
-            if type == "sequence":
+            if type == SEQUENCE:
                 speed += action.previous_fire_speed
-            elif type == "relative":
+            elif type == RELATIVE:
                 # The reference Noiz implementation uses
                 # prvFireSpeed here, but the standard is
                 # pretty clear -- "In case of the type is
@@ -855,9 +1031,9 @@ class FireDef(object):
         y = owner.y
         if self.offset is not None:
             off_x, off_y = self.offset(params, rank)
-            if self.offset.type == "relative":
-                s = sin(direction)
-                c = cos(direction)
+            if self.offset.type_id == RELATIVE:
+                s = _sin(direction)
+                c = _cos(direction)
                 x += c * off_x + s * off_y
                 y += s * off_x - c * off_y
             else:
@@ -879,6 +1055,8 @@ class FireDef(object):
 class FireRef(object):
     """Fire a bullet by name with parameters."""
 
+    __slots__ = ("fire", "params")
+
     def __init__(self, fire, params=None):
         self.fire = fire
         self.params = params or ParamList()
@@ -900,7 +1078,7 @@ class FireRef(object):
     @classmethod
     def FromXML(cls, doc, element):
         """Construct using an ElementTree-style element."""
-        fired = cls(element.get("label"), ParamList.FromXML(doc, element))
+        fired = cls(_label(element), ParamList.FromXML(doc, element))
         doc._fire_refs.append(fired)
         return fired
 
@@ -944,46 +1122,71 @@ class BulletML(object):
 
     @classmethod
     def FromXML(cls, source):
-        """Return a BulletML instance based on XML."""
-        if not hasattr(source, 'read'):
-            source = StringIO(source)
+        """Return a BulletML instance based on XML.
 
-        tree = ElementTree()
-        root = tree.parse(source)
-
-        doc = cls(type=root.get("type", "none"))
-
-        doc._bullets = {}
-        doc._actions = {}
-        doc._fires = {}
-        doc._bullet_refs = []
-        doc._action_refs = []
-        doc._fire_refs = []
-
-        for element in list(root):
-            tag = realtag(element)
-            if tag in doc.CONSTRUCTORS:
-                doc.CONSTRUCTORS[tag].FromXML(doc, element)
-
-        try:
-            for ref in doc._bullet_refs:
-                ref.bullet = doc._bullets[ref.bullet]
-            for ref in doc._fire_refs:
-                ref.fire = doc._fires[ref.fire]
-            for ref in doc._action_refs:
-                ref.action = doc._actions[ref.action]
-        except KeyError as exc:
-            raise ParseError("unknown reference %s" % exc)
-
-        doc.actions = [act for name, act in doc._actions.items()
-                        if name and name.startswith("top")]
+        The source may be a file, string, or bytes-like object.
+        Top-level elements are built as they are parsed, so the whole
+        XML tree is never held in memory at once.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(bytes(source))
+        elif not hasattr(source, 'read'):
+            # Expat is faster given UTF-8 than text, but if the text
+            # declares its encoding, expat would use that instead.
+            end = source.find("?>") if source.startswith("<?xml") else -1
+            if end != -1 and "encoding" in source[:end]:
+                source = StringIO(source)
+            else:
+                source = BytesIO(source.encode("utf-8"))
+
+        doc = None
+        depth = 0
+
+        # Build each top-level element as soon as it has been parsed,
+        # and then throw its tree away, rather than holding the whole
+        # document's tree at once.
+        for event, element in iterparse(source, events=("start", "end")):
+            if event == "start":
+                if doc is None:
+                    doc = cls(type=element.get("type", "none"))
+                    # Parse state lives on doc, not a separate context
+                    # object, so constructors keep the documented
+                    # FromXML(doc, element) signature.
+                    doc._bullets = {}
+                    doc._actions = {}
+                    doc._top_actions = {}
+                    doc._fires = {}
+                    doc._bullet_refs = []
+                    doc._action_refs = []
+                    doc._fire_refs = []
+                    doc._shared = {}
+                    constructors = doc.CONSTRUCTORS
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                ctr = constructors.get(realtag(element))
+                if ctr is not None:
+                    ctr.FromXML(doc, element)
+                element.clear()
+
+        for ref in doc._bullet_refs:
+            ref.bullet = _resolve(doc._bullets, ref.bullet, "bullet")
+        for ref in doc._fire_refs:
+            ref.fire = _resolve(doc._fires, ref.fire, "fire")
+        for ref in doc._action_refs:
+            ref.action = _resolve(doc._actions, ref.action, "action")
+
+        doc.actions = list(doc._top_actions.values())
 
         del(doc._bullet_refs)
         del(doc._action_refs)
         del(doc._fire_refs)
         del(doc._bullets)
         del(doc._actions)
+        del(doc._top_actions)
         del(doc._fires)
+        del(doc._shared)
         
         return doc
 
@@ -993,29 +1196,35 @@ class BulletML(object):
 
         # Late import to avoid a circular dependency.
         try:
-            import bulletml.bulletyaml
+            from bulletml.bulletyaml import Loader
             import yaml
         except ImportError:
             raise ParseError("PyYAML is not available")
         else:
+            if isinstance(source, (bytearray, memoryview)):
+                source = bytes(source)
             try:
-                return yaml.load(source)
+                return yaml.load(source, Loader=Loader)
             except Exception as exc:
                 raise ParseError(str(exc))
 
     @classmethod
     def FromDocument(cls, source):
-        """Create a BulletML instance based on a seekable file or string.
+        """Create a BulletML instance based on a seekable file, string,
+        or bytes-like object.
 
         This attempts to autodetect if the stream is XML or YAML.
         """
-        if not hasattr(source, 'read'):
-            source = StringIO(source)
-        start = source.read(1)
-        source.seek(0)
-        if start == "<":
+        if hasattr(source, 'read'):
+            start = source.read(1)
+            source.seek(0)
+        elif isinstance(source, str):
+            start = source[:1]
+        else:
+            start = bytes(source[:1])
+        if start in ("<", b"<"):
             return cls.FromXML(source)
-        elif start == "!" or start == "#":
+        elif start in ("!", "#", b"!", b"#"):
             return cls.FromYAML(source)
         else:
             raise ParseError("unknown initial character %r" % start)
@@ -1024,18 +1233,42 @@ class BulletML(object):
         return "%s(type=%r, actions=%r)" % (
             type(self).__name__, self.type, self.actions)
 
-ActionDef.CONSTRUCTORS = dict(
-    repeat=Repeat,
-    fire=FireDef,
-    fireRef=FireRef,
-    changeSpeed=ChangeSpeed,
-    changeDirection=ChangeDirection,
-    accel=Accel,
-    wait=Wait,
-    vanish=Vanish,
-    tag=Tag,
-    appearance=Appearance,
-    untag=Untag,
-    action=ActionDef,
-    actionRef=ActionRef)
-ActionDef.CONSTRUCTORS["if"] = If
+# Looking tags up here is several times faster than scanning a tuple
+# of (tag, class) pairs, even with interned tags.
+ActionDef.CONSTRUCTORS = {
+    "repeat": Repeat,
+    "fire": FireDef,
+    "fireRef": FireRef,
+    "changeSpeed": ChangeSpeed,
+    "changeDirection": ChangeDirection,
+    "accel": Accel,
+    "wait": Wait,
+    "vanish": Vanish,
+    "tag": Tag,
+    "appearance": Appearance,
+    "untag": Untag,
+    "action": ActionDef,
+    "actionRef": ActionRef,
+    "if": If,
+    }
+
+# Actions whose only state is what they were parsed from. Equal ones
+# in a document are parsed into one shared instance. Subclasses may
+# add state the key doesn't know about, so only these exact types are
+# shared.
+SHARED = frozenset([Wait, Vanish, Tag, Untag, Appearance,
+                    ChangeSpeed, ChangeDirection, Accel])
+
+def _share_key(action):
+    """Return a key equal for actions that behave the same.
+
+    NumberDefs are already shared by expression, so they compare by
+    identity.
+    """
+    key = [type(action)]
+    for name in action.__slots__:
+        value = getattr(action, name)
+        if isinstance(value, (Direction, Speed)):
+            value = (type(value), value.type_id, value.value)
+        key.append(value)
+    return tuple(key)
@@ -0,0 +1,229 @@
+"""Bullet pools backed by NumPy arrays.
+
+A BulletPool stores the numeric state of its bullets -- position,
+previous position, acceleration, direction, and speed -- in one
+NumPy array per field, rather than on each Bullet instance. Actions
+still run per-bullet in Python and read and write through to the
+arrays, but moving the bullets is done for the whole pool at once.
+
+This module requires NumPy. If Numba is installed, moving part of a
+pool is compiled with it.
+
+Basic Usage:
+
+    from bulletml.pool import BulletPool
+
+    pool = BulletPool()
+    pool.Bullet.FromDocument(doc, x, y, target=player, rank=rank)
+    ...
+    new = pool.step() # Step every live bullet, return new Bullets
+    for bullet in pool.bullets(): ...
+
+Bullets fired by pooled bullets are allocated in the same pool.
+"""
+
+from __future__ import division
+
+from math import atan2, sin, cos
+
+import numpy as np
+
+from bulletml.impl import Bullet
+
+try:
+    from bulletml._pool_nb import _step_positions_kernel
+except ImportError:
+    _step_positions_kernel = None
+
+__all__ = ["BulletPool", "PoolBullet"]
+
+FIELDS = ("x", "y", "px", "py", "mx", "my", "direction", "speed")
+
+def _field(row, name):
+    def fget(self):
+        return self.pool.data[row, self.index]
+
+    def fset(self, value):
+        self.pool.data[row, self.index] = value
+
+    return property(fget, fset, doc="%s, stored in the pool" % name)
+
+class PoolBullet(Bullet):
+    """A Bullet whose numeric state lives in a BulletPool.
+
+    Don't construct this directly; use BulletPool.Bullet, which is a
+    subclass bound to that pool.
+    """
+
+    pool = None
+
+    def __init__(self, x=0, y=0, direction=0, speed=0, target=None,
+                 actions=(), rank=0.5, tags=(), appearance=None,
+                 radius=0.5):
+        self.index = self.pool.alloc(self)
+        super(PoolBullet, self).__init__(
+            x=x, y=y, direction=direction, speed=speed, target=target,
+            actions=actions, rank=rank, tags=tags, appearance=appearance,
+            radius=radius)
+        # The compiled Bullet sets its own fields rather than ours.
+        self.pool.data[:, self.index] = (x, y, x, y, 0, 0, direction, speed)
+
+    @property
+    def aim(self):
+        """Angle to the target, in radians.
+
+        If the target does not exist or cannot be found, return 0.
+        """
+        try:
+            target_x = self.target.x
+            target_y = self.target.y
+        except AttributeError:
+            return 0
+        else:
+            return atan2(target_x - self.x, target_y - self.y)
+
+    def __repr__(self):
+        return ("%s(%r, %r, accel=%r, direction=%r, speed=%r, "
+                "actions=%r, target=%r, appearance=%r, vanished=%r)") % (
+            type(self).__name__, self.x, self.y, (self.mx, self.my),
+            self.direction, self.speed, self.actions, self.target,
+            self.appearance, self.vanished)
+
+    def step_actions(self):
+        """Run this bullet's actions for one frame, but don't move it.
+
+        It returns any new bullets this bullet spawned during this step.
+        """
+        created = []
+
+        finished = self.vanished
+        for action in self.actions:
+            action.step(self, created)
+            finished = finished and action.finished
+        if finished:
+            for action in self.actions:
+                finished = finished and action.finished
+        self.finished = finished
+        return created
+
+    def step(self):
+        """Advance by one frame.
+
+        This is the same as Bullet.step. To step all the bullets in a
+        pool at once, use BulletPool.step instead.
+        """
+        created = self.step_actions()
+        speed = self.speed
+        direction = self.direction
+        self.px = self.x
+        self.py = self.y
+        self.x += self.mx + sin(direction) * speed
+        self.y += -self.my + cos(direction) * speed
+        return created
+
+for _row, _name in enumerate(FIELDS):
+    setattr(PoolBullet, _name, _field(_row, _name))
+del(_row, _name)
+
+class BulletPool(object):
+    """A set of bullets with array-backed numeric state.
+
+    Attributes:
+    data - 2D array of bullet state, one row per field
+    x, y, px, py, mx, my, direction, speed - views of the rows of data
+    live - boolean array, true for allocated slots
+    Bullet - a PoolBullet subclass that allocates in this pool
+
+    Slots past the highest allocated one are not guaranteed to be zero.
+
+    """
+
+    def __init__(self, size=1024):
+        self.data = np.zeros((len(FIELDS), size))
+        self.live = np.zeros(size, dtype=bool)
+        self._bullets = [None] * size
+        self._free = list(range(size - 1, -1, -1))
+        self._bind()
+        self.Bullet = type("Bullet", (PoolBullet,), dict(pool=self))
+
+    def __len__(self):
+        return len(self._bullets) - len(self._free)
+
+    def _bind(self):
+        for row, name in enumerate(FIELDS):
+            setattr(self, name, self.data[row])
+
+    def _grow(self):
+        size = len(self._bullets)
+        self.data = np.concatenate((self.data, np.zeros_like(self.data)), 1)
+        self.live = np.concatenate((self.live, np.zeros(size, dtype=bool)))
+        self._bullets.extend([None] * size)
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+        self._bind()
+
+    def alloc(self, bullet):
+        """Allocate a slot for a bullet and return its index."""
+        if not self._free:
+            self._grow()
+        index = self._free.pop()
+        self.live[index] = True
+        self._bullets[index] = bullet
+        return index
+
+    def release(self, bullet):
+        """Free a bullet's slot.
+
+        The bullet must not be stepped or have its state read after
+        this.
+        """
+        index = bullet.index
+        self.data[:, index] = 0
+        self.live[index] = False
+        self._bullets[index] = None
+        self._free.append(index)
+
+    def bullets(self):
+        """Return a list of the live bullets."""
+        return [bullet for bullet in self._bullets if bullet is not None]
+
+    def step_positions(self, mask=None):
+        """Move bullets one frame based on their speed and direction.
+
+        If a boolean mask is given, only those bullets are moved.
+        Otherwise every slot is moved; free slots have zero speed and
+        acceleration, so they stay where they are.
+        """
+        if mask is None:
+            x, y, px, py, mx, my, direction, speed = self.data
+            px[:] = x
+            py[:] = y
+            x += mx + np.sin(direction) * speed
+            y += np.cos(direction) * speed - my
+        elif _step_positions_kernel is not None:
+            _step_positions_kernel(self.data, np.asarray(mask, dtype=bool))
+        else:
+            idx = np.nonzero(mask)[0]
+            x, y, px, py, mx, my, direction, speed = self.data[:, idx]
+            self.px[idx] = x
+            self.py[idx] = y
+            self.x[idx] = x + mx + np.sin(direction) * speed
+            self.y[idx] = y + np.cos(direction) * speed - my
+
+    def step(self):
+        """Advance every live bullet by one frame.
+
+        This runs each bullet's actions, then moves them all at once.
+        Finished bullets are released from the pool.
+
+        It returns any new bullets spawned during this step. They have
+        not moved yet.
+        """
+        created = []
+        stepped = np.copy(self.live)
+        for bullet in self.bullets():
+            created.extend(bullet.step_actions())
+        self.step_positions(stepped)
+        for bullet in self.bullets():
+            if bullet.finished:
+                self.release(bullet)
+        return created
@@ -9,6 +9,11 @@ from distutils.core import setup, Command, Extension
 from distutils.command.clean import clean as distutils_clean
 from distutils.command.sdist import sdist as distutils_sdist
 
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
 
 class clean(distutils_clean):
     def run(self):
@@ -61,16 +66,18 @@ class coverage_cmd(Command):
         def run_tests():
             import bulletml
             try:
-                reload(bulletml)
-            except NameError:
-                pass
+                from importlib import reload
+            except ImportError:
+                pass # Python 2's is a builtin.
+            reload(bulletml)
             self.run_command("test")
 
         tracer.runfunc(run_tests)
         results = tracer.results()
         coverage = os.path.join(os.path.dirname(__file__), "coverage")
         results.write_results(show_missing=True, coverdir=coverage)
-        map(os.unlink, glob.glob(os.path.join(coverage, "[!b]*.cover")))
+        for filename in glob.glob(os.path.join(coverage, "[!b]*.cover")):
+            os.unlink(filename)
         try:
             os.unlink(os.path.join(coverage, "..setup.cover"))
         except OSError:
@@ -79,7 +86,8 @@ class coverage_cmd(Command):
         total_lines = 0
         bad_lines = 0
         for filename in glob.glob(os.path.join(coverage, "*.cover")):
-            lines = open(filename, "rU").readlines()
+            with open(filename) as fileobj:
+                lines = fileobj.readlines()
             total_lines += len(lines)
             bad_lines += len(
                 [line for line in lines if
@@ -115,6 +123,37 @@ class test_cmd(Command):
         if tests.unit(self.to_run):
             raise SystemExit("Test failures are listed above.")
 
+
+def ext_modules():
+    if sys.platform == "win32":
+        args = ["/O2", "/fp:fast"]
+        native = ["/arch:AVX2"]
+    else:
+        args = ["-O3", "-ffast-math"]
+        native = ["-march=native"]
+    # Building for this machine's CPU lets _collision.c use AVX, but
+    # the result may not run on other machines.
+    if os.environ.get("BULLETML_NATIVE"):
+        args += native
+    modules = [Extension(
+        'bulletml._collision',
+        [os.path.join('bulletml', '_collision.c')],
+        extra_compile_args=args)]
+    if cythonize is not None:
+        # parser.py is compiled as plain Python; the compiled module
+        # is imported in its place. It mostly speeds up actions;
+        # parsing, which is dominated by expat, only gains ~10%.
+        modules.extend(cythonize([
+            Extension('bulletml._impl',
+                      [os.path.join('bulletml', '_impl.pyx')],
+                      extra_compile_args=args),
+            Extension('bulletml.parser',
+                      [os.path.join('bulletml', 'parser.py')],
+                      extra_compile_args=args),
+            ], compiler_directives=dict(language_level=3)))
+    return modules
+
+
 if __name__ == "__main__":
     setup(cmdclass=dict(clean=clean, test=test_cmd, coverage=coverage_cmd,
                         sdist=sdist),
@@ -127,9 +166,7 @@ if __name__ == "__main__":
           packages=["bulletml"],
           data_files=glob.glob("examples/*/*.xml") + ["examples/template.xml"],
           scripts=["bulletml-runner", "bulletml-to-bulletyaml"],
-          ext_modules=[Extension(
-              'bulletml._collision',
-              [os.path.join('bulletml', '_collision.c')])],
+          ext_modules=ext_modules(),
           long_description="""\
 BulletML is the Bullet Markup Language. BulletML can describe the
 barrage of bullets in shooting games. (For example Progear, Psyvariar,
@@ -38,6 +38,11 @@ class Tcollides(TestCase):
         a = Dummy(100, 0, 100, 0, 1)
         b = Dummy(0, 100, 100, 0, 1)
         self.failUnless(collision.collides(a, b))
+
+    def test_same_motion(self):
+        a = Dummy(10, 10, 0, 0, 1)
+        self.failUnless(collision.collides(a, Dummy(11, 11, 1, 1, 1)))
+        self.failIf(collision.collides(a, Dummy(13, 10, 3, 0, 1)))
 add(Tcollides)
 
 class Tcollides_all(TestCase):
@@ -47,4 +52,80 @@ class Tcollides_all(TestCase):
         c = Dummy(0, 100, 100, 0, 1)
         collides = collision.collides_all(a, [a, b, c])
         self.failUnlessEqual(collides, [a, c])
+
+    def test_mutating_others(self):
+        others = []
+
+        class Clearing(object):
+            y = px = py = 0
+            radius = 1
+
+            @property
+            def x(self):
+                del others[:]
+                return 0
+
+        a = Dummy(0, 0, 0, 0, 1)
+        items = [Clearing() for i in range(10)]
+        others.extend(items)
+        collides = collision.collides_all(a, others)
+        self.failUnlessEqual(collides, items)
 add(Tcollides_all)
+
+try:
+    import numpy
+except ImportError:
+    pass
+else:
+    class Tcollides_all_np(TestCase):
+        def test_cross(self):
+            a = Dummy(0, 0, 100, 100, 1)
+            others = [a, Dummy(100, 100, 0, 100, 1), Dummy(0, 100, 100, 0, 1)]
+            idxs = collision.collides_all_np(
+                a.x, a.y, a.px, a.py, a.radius,
+                *[numpy.array(field) for field in zip(*others)])
+            self.failUnlessEqual(list(idxs), [0, 2])
+
+        def test_matches_collides(self):
+            a = Dummy(0, 0, 100, 100, 1)
+            others = [Dummy(x, y, px, py, 1)
+                      for x in [0, 50, 100] for y in [0, 50, 100]
+                      for px in [0, 100] for py in [0, 100]]
+            self.failUnlessEqual(
+                collision.collides_all(a, others),
+                [o for o in others if collision.collides(a, o)])
+
+        def test_np_matches_collides(self):
+            a = Dummy(0, 0, 100, 100, 1)
+            # Not a multiple of the SIMD width, to test the remainder.
+            others = [Dummy(x, y, px, py, 1)
+                      for x in [0, 50, 100] for y in [0, 50, 100]
+                      for px in [0, 100] for py in [0, 100]][:-1]
+            idxs = collision.collides_all_np(
+                a.x, a.y, a.px, a.py, a.radius,
+                *[numpy.array(field) for field in zip(*others)])
+            self.failUnlessEqual(
+                list(idxs), [i for i, o in enumerate(others)
+                             if collision.collides(a, o)])
+    add(Tcollides_all_np)
+
+class TSpatialGrid(TestCase):
+    def test_cross(self):
+        a = Dummy(0, 0, 100, 100, 1)
+        b = Dummy(100, 100, 0, 100, 1)
+        c = Dummy(0, 100, 100, 0, 1)
+        grid = collision.SpatialGrid(8)
+        grid.rebuild([a, b, c])
+        self.failUnlessEqual(grid.collides_all(a), [a, c])
+
+    def test_matches_collides_all(self):
+        others = [Dummy(x, y, x - dx, y - dy, 1)
+                  for x in range(-20, 20, 3) for y in range(-20, 20, 3)
+                  for dx in [-2, 0, 2] for dy in [-3, 0, 3]]
+        grid = collision.SpatialGrid(4)
+        grid.rebuild(others)
+        for a in [Dummy(0, 0, 0, 0, 1), Dummy(5, -5, -5, 5, 2)]:
+            self.failUnlessEqual(
+                grid.collides_all(a), collision.collides_all(a, others))
+            self.failUnless(len(grid.query(a)) < len(others))
+add(TSpatialGrid)
@@ -1,3 +1,4 @@
+import functools
 import os
 import glob
 
@@ -16,11 +17,20 @@ class Texamples_repr(TestCase):
 class Texamples_run(TestCase):
     pass
 
+@functools.lru_cache(maxsize=None)
+def _load(filename):
+    """Parse an example once, for all the tests that use it."""
+    with open(filename, "rb") as fileobj:
+        return BulletML.FromDocument(fileobj)
+
+# The examples are parsed from source on every run, rather than from
+# a pickled cache; all of them together parse in a few milliseconds,
+# and a cache could hide parser changes.
 for filename in glob.glob("examples/*/*.xml"):
     basename = os.path.basename(filename)[:-4].replace("-", "_")
 
     def test_xml(self, filename=filename):
-        BulletML.FromDocument(open(filename, "rU"))
+        _load(filename)
     setattr(Texamples_xml, "test_" + basename, test_xml)
 
     try:
@@ -29,22 +39,27 @@ for filename in glob.glob("examples/*/*.xml"):
         pass
     else:
         def test_yaml(self, filename=filename):
-            doc = BulletML.FromDocument(open(filename, "rU"))
-            doc = yaml.load(yaml.dump(doc))
-            doc = yaml.load(yaml.dump(doc))
+            # Reloading and dumping again should change nothing.
+            dumped = yaml.dump(_load(filename), Dumper=bulletyaml.Dumper)
+            doc = BulletML.FromYAML(dumped)
+            self.failUnlessEqual(
+                yaml.dump(doc, Dumper=bulletyaml.Dumper), dumped)
         setattr(Texamples_yaml, "test_" + basename, test_yaml)
 
     def test_repr(self, filename=filename):
-        doc = BulletML.FromDocument(open(filename, "rU"))
+        doc = _load(filename)
         repr(doc)
     setattr(Texamples_repr, "test_" + basename, test_repr)
 
     def test_run(self, filename=filename):
-        doc = BulletML.FromDocument(open(filename, "rU"))
+        doc = _load(filename)
         bullets = [Bullet.FromDocument(doc)]
         for i in range(100):
+            # Bullets fired this frame first move on the next one.
+            created = []
             for bullet in bullets:
-                bullets.extend(bullet.step())
+                created.extend(bullet.step())
+            bullets.extend(created)
     setattr(Texamples_run, "test_" + basename, test_run)
                 
 
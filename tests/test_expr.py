@@ -0,0 +1,25 @@
+from tests import TestCase, add
+
+from bulletml.expr import NumberDef, INumberDef, ExprError, _instance
+
+class TNumberDef(TestCase):
+    def test_constant(self):
+        self.failUnlessEqual(NumberDef("360/16")([], 0.5), 22.5)
+        self.failUnlessEqual(INumberDef("360/16")([], 0.5), 22)
+
+    def test_params(self):
+        self.failUnlessEqual(NumberDef("(2+$1)*$rank")([3], 0.5), 2.5)
+
+    def test_shared(self):
+        self.failUnless(NumberDef("180-$rank*20") is NumberDef("180-$rank*20"))
+        self.failIf(NumberDef("180-$rank*20") is INumberDef("180-$rank*20"))
+
+    def test_dunder(self):
+        self.failUnlessRaises(ExprError, NumberDef, "().__class__")
+
+    def test_invalid_not_cached(self):
+        size = _instance.cache_info().currsize
+        self.failUnlessRaises(ExprError, NumberDef, "1 +* 2")
+        self.failUnlessRaises(ExprError, NumberDef, "1 +* 2")
+        self.failUnlessEqual(_instance.cache_info().currsize, size)
+add(TNumberDef)
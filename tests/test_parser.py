@@ -0,0 +1,206 @@
+from io import BytesIO
+from xml.etree.ElementTree import Element
+
+from tests import TestCase, add
+
+from bulletml import BulletML, Bullet, parser
+from bulletml.expr import NumberDef
+from bulletml.impl import Action
+from bulletml.parser import ParseError
+
+class Trealtag(TestCase):
+    def test_namespace(self):
+        self.failUnlessEqual(parser.realtag(Element(
+            "{http://www.asahi-net.or.jp/~cs8k-cyu/bulletml}action")),
+            "action")
+
+    def test_plain(self):
+        self.failUnlessEqual(parser.realtag(Element("action")), "action")
+
+    def test_document_without_namespace(self):
+        doc = BulletML.FromXML(
+            '<bulletml><action label="top"><wait>1</wait></action></bulletml>')
+        self.failUnlessEqual(len(doc.actions), 1)
+add(Trealtag)
+
+class TMissing(TestCase):
+    def parse(self, body):
+        return BulletML.FromXML(
+            '<bulletml><action label="top">%s</action></bulletml>' % body)
+
+    def test_complete(self):
+        self.parse('<repeat><times>2</times><action/></repeat>')
+
+    def test_missing(self):
+        for body in ['<changeDirection><term>1</term></changeDirection>',
+                     '<changeSpeed><speed>1</speed></changeSpeed>',
+                     '<repeat><action/></repeat>',
+                     '<accel><horizontal>1</horizontal></accel>',
+                     '<fire><direction>1</direction></fire>']:
+            self.failUnlessRaises(ParseError, self.parse, body)
+add(TMissing)
+
+class TShared(TestCase):
+    def test_shared(self):
+        doc = BulletML.FromXML(
+            '<bulletml><action label="top">'
+            '<wait>1</wait><wait>1</wait><wait>2</wait>'
+            '<changeSpeed><speed>1</speed><term>2</term></changeSpeed>'
+            '<changeSpeed><speed>1</speed><term>2</term></changeSpeed>'
+            '<changeSpeed><speed type="relative">1</speed><term>2</term>'
+            '</changeSpeed>'
+            '</action></bulletml>')
+        actions = doc.actions[0].actions
+        self.failUnless(actions[0] is actions[1])
+        self.failIf(actions[0] is actions[2])
+        self.failUnless(actions[3] is actions[4])
+        self.failIf(actions[3] is actions[5])
+
+    def test_subclass(self):
+        class MyWait(parser.Wait):
+            __slots__ = ("extra",)
+
+        constructors = parser.ActionDef.CONSTRUCTORS
+        constructors["wait"] = MyWait
+        try:
+            doc = BulletML.FromXML(
+                '<bulletml><action label="top">'
+                '<wait>1</wait><wait>1</wait><wait>2</wait>'
+                '</action></bulletml>')
+        finally:
+            constructors["wait"] = parser.Wait
+        actions = doc.actions[0].actions
+        self.failIf(actions[0] is actions[1])
+        self.failUnlessEqual(
+            [action.frames.expr for action in actions], [1, 1, 2])
+add(TShared)
+
+class TOffset(TestCase):
+    def test_constant(self):
+        offset = parser.Offset("relative", NumberDef("2"), None)
+        self.failUnlessEqual(offset((), 0.5), (2, 0))
+
+    def test_variable(self):
+        offset = parser.Offset("absolute", NumberDef("$rank * 2"),
+                               NumberDef("$1"))
+        self.failUnlessEqual(offset((3,), 0.5), (1, 3))
+add(TOffset)
+
+class TReferences(TestCase):
+    def test_unknown(self):
+        for body in ['<fire><bulletRef label="x"/></fire>',
+                     '<actionRef label="x"/>', '<fireRef label="x"/>']:
+            self.failUnlessRaises(
+                ParseError, BulletML.FromXML,
+                '<bulletml><action label="top">%s</action></bulletml>' % body)
+add(TReferences)
+
+class TFromDocument(TestCase):
+    XML = '<bulletml><action label="top"><wait>1</wait></action></bulletml>'
+
+    def test_str(self):
+        self.failUnlessEqual(len(BulletML.FromDocument(self.XML).actions), 1)
+
+    def test_bytes(self):
+        doc = BulletML.FromDocument(self.XML.encode("utf-8"))
+        self.failUnlessEqual(len(doc.actions), 1)
+
+    def test_binary_file(self):
+        doc = BulletML.FromDocument(BytesIO(self.XML.encode("utf-8")))
+        self.failUnlessEqual(len(doc.actions), 1)
+
+    def test_example_bytearray(self):
+        with open("examples/normal/s-fall.xml", "rb") as fileobj:
+            data = fileobj.read()
+        self.failUnlessEqual(
+            repr(BulletML.FromDocument(bytearray(data))),
+            repr(BulletML.FromDocument(data)))
+
+    def test_example_memoryview(self):
+        with open("examples/normal/s-fall.xml", "rb") as fileobj:
+            data = fileobj.read()
+        self.failUnlessEqual(
+            repr(BulletML.FromDocument(memoryview(data))),
+            repr(BulletML.FromDocument(data)))
+
+    def test_yaml_bytearray(self):
+        try:
+            import yaml
+            from bulletml.bulletyaml import Dumper
+        except ImportError:
+            return
+        doc = BulletML.FromDocument(self.XML)
+        data = bytearray(yaml.dump(doc, Dumper=Dumper).encode("utf-8"))
+        self.failUnlessEqual(
+            repr(BulletML.FromDocument(data)), repr(doc))
+
+    def test_unknown(self):
+        self.failUnlessRaises(ParseError, BulletML.FromDocument, "x")
+        self.failUnlessRaises(ParseError, BulletML.FromDocument, b"x")
+        self.failUnlessRaises(
+            ParseError, BulletML.FromDocument, memoryview(b"x"))
+add(TFromDocument)
+
+class TActionDef(TestCase):
+    def test_reassign(self):
+        dfn = parser.ActionDef([parser.Wait(NumberDef("1"))])
+        self.failUnlessEqual(len(dfn.code), 1)
+        dfn.actions = [parser.Wait(NumberDef("1")), parser.Vanish()]
+        self.failUnlessEqual(len(dfn.code), 2)
+
+    def test_invalidate(self):
+        dfn = parser.ActionDef([parser.Wait(NumberDef("1"))])
+        self.failUnlessEqual(len(dfn.code), 1)
+        dfn.actions.append(parser.Vanish())
+        dfn.invalidate()
+        self.failUnlessEqual(len(dfn.code), 2)
+
+    def test_raw_actions(self):
+        # Actions given action objects, not compiled code, still run.
+        bullet = Bullet()
+        action = Action(None, [parser.Vanish()], (), 0.5)
+        bullet.actions = [action]
+        bullet.step()
+        self.failUnless(bullet.vanished)
+add(TActionDef)
+
+class TTopActions(TestCase):
+    def test_order(self):
+        doc = BulletML.FromXML(
+            '<bulletml><action label="top2"><wait>2</wait></action>'
+            '<action label="other"><wait>3</wait></action>'
+            '<action label="top1"><wait>1</wait></action></bulletml>')
+        self.failUnlessEqual(
+            [action.actions[0].frames.expr for action in doc.actions], [2, 1])
+add(TTopActions)
+
+class TEncoding(TestCase):
+    BODY = ('<bulletml><action label="top"><fire><bullet/>'
+            '<appearance>é</appearance></fire></action></bulletml>')
+
+    def appearance(self, source):
+        return BulletML.FromXML(source).actions[0].actions[0].appearance
+
+    def test_str(self):
+        self.failUnlessEqual(self.appearance(self.BODY), "é")
+
+    def test_declared_str(self):
+        self.failUnlessEqual(self.appearance(
+            '<?xml version="1.0" encoding="ISO-8859-1"?>' + self.BODY),
+            "é")
+
+    def test_declared_bytes(self):
+        self.failUnlessEqual(self.appearance(
+            ('<?xml version="1.0" encoding="ISO-8859-1"?>'
+             + self.BODY).encode("iso-8859-1")), "é")
+
+    def test_unclosed_declaration(self):
+        # Without "?>" there is no declaration to take an encoding from.
+        self.failUnlessRaises(
+            SyntaxError, self.appearance,
+            '<?xml version="1.0" encoding="ISO-8859-1"' + self.BODY)
+
+    def test_encoding_after_declaration(self):
+        self.failUnlessEqual(self.appearance(
+            '<?xml version="1.0"?><!-- encoding -->' + self.BODY), "é")
+add(TEncoding)
@@ -0,0 +1,53 @@
+import glob
+import random
+
+from tests import TestCase, add
+
+from bulletml import BulletML, Bullet
+
+try:
+    from bulletml.pool import BulletPool
+except ImportError:
+    pass
+else:
+    class Target(object):
+        x = 100
+        y = 50
+
+    class TBulletPool(TestCase):
+        def run_plain(self, doc):
+            random.seed(0)
+            bullets = [Bullet.FromDocument(doc, x=150, y=150, target=Target)]
+            for i in range(100):
+                created = []
+                for bullet in bullets:
+                    created.extend(bullet.step())
+                bullets = [b for b in bullets if not b.finished] + created
+            return bullets
+
+        def run_pool(self, doc):
+            random.seed(0)
+            pool = BulletPool(16)
+            pool.Bullet.FromDocument(doc, x=150, y=150, target=Target)
+            for i in range(100):
+                pool.step()
+            return pool.bullets()
+
+        def test_examples(self):
+            for filename in glob.glob("examples/*/*.xml"):
+                with open(filename, "rb") as fileobj:
+                    doc = BulletML.FromDocument(fileobj)
+                plain = sorted((round(b.x, 6), round(b.y, 6))
+                               for b in self.run_plain(doc))
+                pooled = sorted((round(b.x, 6), round(b.y, 6))
+                                for b in self.run_pool(doc))
+                self.failUnlessEqual(plain, pooled)
+
+        def test_release(self):
+            pool = BulletPool(2)
+            bullets = [pool.Bullet(x=i) for i in range(5)]
+            self.failUnlessEqual(len(pool), 5)
+            pool.release(bullets[0])
+            self.failUnlessEqual(len(pool), 4)
+            self.failUnlessEqual(pool.Bullet(x=9).index, bullets[0].index)
+    add(TBulletPool)